@@ -1,3 +1,4 @@
-from mkblogs.build.build_blogs import build
+from mkblogs.build.build_blogs import build, reindex
+from mkblogs.build.build_pages import compile_theme
 
-__all__=['build']
+__all__=['build', 'reindex', 'compile_theme']
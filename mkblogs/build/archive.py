@@ -0,0 +1,357 @@
+# coding: utf-8
+
+"""
+The older pages of the index and the date archives.
+
+The index shows the 'n_blogs_to_show' newest blogs, the blogs after them are
+listed on page/2.html, page/3.html, ... 'archive_per_page' blogs a page. Every
+year and month with blogs gets pages as well, YYYY/index.html,
+YYYY/page/2.html, ... and YYYY/MM/index.html, YYYY/MM/page/2.html, ... A
+year links to the years next to it and to its months, a month to its year
+and to the months next to it; the dates of the blogs link to their month.
+
+The pages come from one pass over the record, newest first. They are filled
+in that order and handed over as soon as the blog after them is seen, so
+only a page of the index, of the year and of the month are held at a time.
+The neighbours of a year or a month are looked up in the date index. A page
+is rendered when the blogs it lists (or the pages it links to) differ from
+last build, when a blog it lists was renamed, redated or retagged, or when
+its templates or config changed; editing the body of a blog doesn't render
+any of them, a new month renders only the pages of its year and of the
+months next to it.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+from mkblogs import utils
+from mkblogs.build import nav
+from mkblogs.build.build_pages import get_global_context, write_output, \
+        month_page_path, year_page_path, PAGE_CONFIG_KEYS
+from mkblogs.build.manifest import config_fingerprint
+from mkblogs.build.record import open_record
+
+log = logging.getLogger('mkblogs')
+
+ARCHIVE_CONFIG_KEYS = PAGE_CONFIG_KEYS + ('archive_per_page',)
+
+ARCHIVE_PAGE = re.compile(
+        r'^(page/\d+\.html|\d{4}/(\d{2}/)?(index|page/\d+)\.html)$')
+
+
+def index_page_path(number):
+    """
+    the output path of the page @number of the index, the first is index.html
+    """
+    if number == 1:
+        return 'index.html'
+    return 'page/%d.html' % number
+
+
+def page_digest(blogs, previous_path, next_path, links=None):
+    """
+    digest of the paths of the @blogs on a page and of the pages it links to
+    """
+    text = json.dumps([[blog[0] for blog in blogs], previous_path, next_path,
+        links])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def month_of(key):
+    """
+    the (year, month) of the sort_key @key
+    """
+    date = time.localtime(key)
+    return (date.tm_year, date.tm_mon)
+
+
+def next_month(month):
+    year, number = month
+    if number == 12:
+        return (year + 1, 1)
+    return (year, number + 1)
+
+
+def month_start(month):
+    """
+    the sort_key of the first second of @month
+    """
+    return time.mktime(date_of(month))
+
+
+def year_links(record, year):
+    """
+    {'years': [(title, path, active)], 'months': [...]}, the links of the
+    archive of @year: the years next to it, newest first, and its months,
+    each found in the date index of @record
+    """
+    end = month_start((year + 1, 1))
+    newer = record.oldest_from(end)
+    older = record.newest_before(month_start((year, 1)))
+    years = [year]
+    if newer is not None:
+        years.insert(0, month_of(newer)[0])
+    if older is not None:
+        years.append(month_of(older)[0])
+
+    months = []
+    key = record.oldest_from(month_start((year, 1)))
+    while key is not None and key < end:
+        months.insert(0, month_of(key))
+        key = record.oldest_from(month_start(next_month(months[0])))
+    return {
+        'years': [(str(y), year_page_path(y), y == year) for y in years],
+        'months': [(time.strftime('%B', date_of(m)), month_page_path(*m),
+            False) for m in months],
+    }
+
+
+def month_links(record, month):
+    """
+    the links of the archive of @month, as year_links: its year, and the
+    months next to it, the months of another year are titled with the year
+    """
+    newer = record.oldest_from(month_start(next_month(month)))
+    older = record.newest_before(month_start(month))
+    months = [month]
+    if newer is not None:
+        months.insert(0, month_of(newer))
+    if older is not None:
+        months.append(month_of(older))
+
+    def title(key):
+        if key[0] == month[0]:
+            return time.strftime('%B', date_of(key))
+        return time.strftime('%B %Y', date_of(key))
+    return {
+        'years': [(str(month[0]), year_page_path(month[0]), False)],
+        'months': [(title(m), month_page_path(*m), m == month)
+            for m in months],
+    }
+
+
+class Listing(object):
+    """
+    The pages of a list of blogs, @per_page blogs a page, numbered from
+    @first. The blogs are added newest first, a page is handed to the
+    ArchiveWriter when the blog after it is added, or when the listing is
+    closed, so it is known whether a page follows. @path_of and @title_of
+    give the path and the title of a page by its number, @links are the
+    year_links or month_links of the pages.
+    """
+    def __init__(self, writer, per_page, path_of, title_of, first=1,
+            links=None):
+        self.writer = writer
+        self.per_page = per_page
+        self.path_of = path_of
+        self.title_of = title_of
+        self.links = links
+        self.number = first
+        self.listed = []
+
+    def add(self, blog):
+        if len(self.listed) == self.per_page:
+            self.hand_over(last=False)
+        self.listed.append(blog)
+
+    def close(self):
+        """
+        hand over the last page, if it lists any blog
+        """
+        if self.listed:
+            self.hand_over(last=True)
+
+    def hand_over(self, last):
+        number = self.number
+        previous_path = self.path_of(number - 1) if number > 1 else None
+        next_path = None if last else self.path_of(number + 1)
+        self.writer.page(self.path_of(number), self.title_of(number),
+                self.listed, previous_path, next_path, self.links)
+        self.number, self.listed = number + 1, []
+
+
+class ArchiveWriter(object):
+    """
+    renders the archive pages as they are completed, skipping those which are
+    up to date in the manifest
+    """
+    def __init__(self, config, site_navigation, env, manifest=None):
+        self.config = config
+        self.site_navigation = site_navigation
+        self.env = env
+        self.manifest = manifest
+        self.record = config.get('record_store') or open_record(config)
+        # None when it is unknown what changed, everything is rendered then
+        self.changed = config.get('changed_blogs')
+        self.config_digest = config_fingerprint(config, ARCHIVE_CONFIG_KEYS)
+        self.template = env.get_template('base.html')
+        self.outputs = set()
+        self.rendered = 0
+
+    def page(self, path, title, blogs, previous_path=None, next_path=None,
+            links=None):
+        """
+        the page @path lists @blogs, (path, title, date, sort_key) newest
+        first, it links to the pages @previous_path and @next_path and to the
+        year_links or month_links @links
+        """
+        self.outputs.add(path)
+        digest = page_digest(blogs, previous_path, next_path, links)
+        if self.manifest and self.changed is not None and \
+                not any(blog[0] in self.changed for blog in blogs) and \
+                self.manifest.generated_fresh(path, self.config_digest,
+                    digest):
+            return
+
+        log.debug("Building the archive page %s", path)
+        page = nav.Page(title, '/' + path, path)
+        entries = self.record.entries(blog[0] for blog in blogs)
+        with self.env.record_templates() as templates:
+            context = get_global_context(page, self.site_navigation,
+                    self.config)
+            context.update(get_archive_context(page, blogs, entries,
+                previous_path, next_path, self.config, links))
+            output_content = self.template.render(context)
+        write_output(self.config, output_content.encode('utf-8'), path)
+        self.rendered += 1
+        if self.manifest:
+            self.manifest.record_generated(path, self.config_digest,
+                    templates, digest)
+
+    def remove_stale(self):
+        """
+        remove the archive pages left from the builds before, a month or a
+        year without blogs anymore, the pages past the last page of the index
+        """
+        if not self.manifest:
+            return
+        for path in self.manifest.generated_outputs():
+            if ARCHIVE_PAGE.match(path) and path not in self.outputs:
+                log.debug("Removing the archive page %s", path)
+                if os.path.exists(path):
+                    os.remove(path)
+                    try:
+                        # the YYYY/MM/ directories of the months gone
+                        os.removedirs(os.path.dirname(path))
+                    except OSError:
+                        pass
+                self.manifest.forget_generated(path)
+
+
+def build_archives(config, site_navigation, env, manifest=None):
+    """
+    render the pages of the index after the first one and the year and month
+    archives, in one pass over the record
+    """
+    first = config.get('n_blogs_to_show') or 5
+    per_page = int(config.get('archive_per_page') or 50)
+    writer = ArchiveWriter(config, site_navigation, env, manifest)
+
+    index = Listing(writer, per_page, index_page_path,
+            lambda number: 'Page %d' % number, first=2)
+    year = month = None
+    year_pages = month_pages = None
+    for rank, blog in enumerate(writer.record.posts()):
+        date = time.localtime(blog[3])
+        if (date.tm_year, date.tm_mon) != month:
+            if month_pages:
+                month_pages.close()
+            month = (date.tm_year, date.tm_mon)
+            month_pages = month_listing(writer, month, per_page)
+        if date.tm_year != year:
+            if year_pages:
+                year_pages.close()
+            year = date.tm_year
+            year_pages = year_listing(writer, year, per_page)
+        month_pages.add(blog)
+        year_pages.add(blog)
+        if rank >= first:
+            index.add(blog)
+
+    for listing in (month_pages, year_pages, index):
+        if listing:
+            listing.close()
+    writer.remove_stale()
+    log.debug("Rendered %d archive pages of %d", writer.rendered,
+            len(writer.outputs))
+
+
+def year_listing(writer, year, per_page):
+    """
+    the Listing of the archive of @year
+    """
+    def title_of(number):
+        if number == 1:
+            return str(year)
+        return '%d, page %d' % (year, number)
+    return Listing(writer, per_page,
+            lambda number: year_page_path(year, number), title_of,
+            links=year_links(writer.record, year))
+
+
+def month_listing(writer, month, per_page):
+    """
+    the Listing of the archive of @month, (year, month)
+    """
+    name = time.strftime('%B %Y', date_of(month))
+
+    def title_of(number):
+        if number == 1:
+            return name
+        return '%s, page %d' % (name, number)
+    return Listing(writer, per_page,
+            lambda number: month_page_path(month[0], month[1], number),
+            title_of, links=month_links(writer.record, month))
+
+
+def date_of(month):
+    """
+    a struct_time in the (year, month) @month, for strftime
+    """
+    return time.struct_time((month[0], month[1], 1, 0, 0, 0, 0, 1, -1))
+
+
+def get_archive_context(page, blogs, entries, previous_path, next_path,
+        config, links=None):
+    """
+    the context of an archive @page listing @blogs, @entries are the record
+    entries of the blogs, @links its year_links or month_links
+    """
+    url_context = page.url_context
+    archive_blogs = []
+    for blog_path, title, date, sort_key in blogs:
+        url = '/' + os.path.join(config['site_dir'],
+                utils.get_html_path(blog_path))
+        entry = entries.get(blog_path)
+        archive_blogs.append({
+            'title': title,
+            'date': date,
+            'tags': entry[2] if entry else [],
+            'url': url_context.make_relative(url),
+        })
+
+    def page_url(path):
+        if not path:
+            return None
+        return url_context.make_relative('/' + path)
+
+    links = links or {}
+
+    def link_list(key):
+        return [{'title': title, 'url': page_url(path), 'active': active}
+                for title, path, active in links.get(key, [])]
+
+    return {
+        'structure': 'archive.html',
+        'page_title': page.title,
+        'archive_blogs': archive_blogs,
+        'archive_years': link_list('years'),
+        'archive_months': link_list('months'),
+        'previous_url': page_url(previous_path),
+        'next_url': page_url(next_path),
+        'current_page': page,
+    }
@@ -10,22 +10,40 @@ from mkblogs import utils
 from mkblogs.build import html as parser
 from mkblogs.compat import urljoin, PY2
 from mkblogs.build import nav
-import jinja2
 import json
 import markdown
 import os
 import logging
 import operator
 import threading
-from multiprocessing import cpu_count as num_of_thread
+from multiprocessing import Pool, cpu_count as num_of_thread
 
-from mkblogs.build.build_pages import build_pages, get_global_context, \
+from mkblogs.build.build_pages import get_global_context, \
         site_directory_contains_stale_files,\
-        build_catalog, build_index
+        build_catalog, build_index, build_404, build_static_pages, \
+        build_generated_page, get_environment, set_builders, \
+        GLOBAL_CONFIG_KEYS
+from mkblogs.build.scheduler import TaskGraph
+from mkblogs.build.manifest import BuildManifest, config_fingerprint
+from mkblogs.build.sources import walk_sources
+from mkblogs.build.cache import open_cache
+from mkblogs.build.meta import meta_entry, read_meta
+from mkblogs.mdextern.relative_path_ext import LinkIndex
+from mkblogs.build.record import open_record
+from mkblogs.build.archive import build_archives
+from mkblogs.build.links import check_links, LinkGraph
+from mkblogs.build.tags import build_tag_pages, touched_tags
 
 log = logging.getLogger('mkblogs')
 omit_path = ['index.md', 'img']
 
+#besides the global context, a blog is built from the navigation, the
+#markdown settings and the directories it is placed in
+BLOG_CONFIG_KEYS = GLOBAL_CONFIG_KEYS + (
+    'pages', 'markdown_extensions', 'markdown_backend', 'strict', 'docs_dir',
+    'site_dir', 'tags_dir', 'excerpt_paragraphs',
+)
+
 
 BLANK_BLOG_CONTEXT = {
         'page_title': None,
@@ -53,6 +71,18 @@ def get_global_blog_context(blog, site_navigation, config):
     return context
 
 
+def num_of_workers(config):
+    """
+    number of blog compiling workers, 'build_workers' in config or one per cpu
+    """
+    if config.get('build_workers'):
+        return int(config['build_workers'])
+    try:
+        return num_of_thread()
+    except NotImplementedError:
+        return 4
+
+
 class BlogsGen(object):
     """
     BlogsGenerator provides all the context for compile every blog,
@@ -74,33 +104,50 @@ class BlogsGen(object):
                 if not blog_path:
                     break
                 blog = self.context.setup_page(blog_path, self.tid)
-                attrs = self.context.build_blog(blog, self.context.site_navigation)
+                try:
+                    attrs = self.context.build_blog(blog,
+                            self.context.site_navigation)
+                except Exception:
+                    log.exception('Error building blog %s', blog_path)
+                    continue
                 self.context.done_work(blog_path, attrs)
     #XXX:init function fixed.
-    def __init__(self, config, tobuild, site_navigation):
+    def __init__(self, config, tobuild, site_navigation, nworker=None,
+            pool=None, output_digests=None, record=None, links=None):
         self.toupdate = utils.AtomicList(tobuild)
         self.updated  = utils.AtomicDict()
+        #the RecordStore the blogs compiled are put in, and the entries they
+        #replace there
+        self.record = record
+        self.previous = utils.AtomicDict()
+        self.deps = utils.AtomicDict()
+        self.output_hashes = utils.AtomicDict()
+        self.written = utils.AtomicCounter()
         self.config = config
         self.blogs = []
-
-        #XXX: step 1 setup n threads
-        try:
-            nthread = num_of_thread()
-        except NotImplementedError:
-            nthread = 4
-        self.workers = []
-        for i in range(nthread):
-            self.workers.append(self.BlogBuilder(self, i))
+        self.pool = pool
+        #digest of every output when it was last written, path -> digest
+        self.output_digests = output_digests or {}
+        #the LinkIndex of the build, a process makes its own
+        self.links = links
+
+        #XXX: step 1 decide how many workers we have, threads are the default,
+        #processes escape the GIL when there is enough blogs to compile
+        self.nworker = nworker or num_of_workers(config)
+        self.mode = config.get('build_mode') or 'thread'
+        if self.mode not in ('thread', 'process'):
+            log.warning("Unknown build_mode '%s', using threads", self.mode)
+            self.mode = 'thread'
 
         #XXX: step 2 generate context for building blogs
         self.site_navigation = site_navigation
-        loader = jinja2.FileSystemLoader(config['templates_dir'])
-        self.env = jinja2.Environment(loader=loader)
+        self.env = get_environment(config)
+        self.cache = open_cache(config)
         dummy = os.path.join(config['docs_dir'], 'dummy')
 
         #XXX: step 3. we have different context for every worker, so there will
         #be no data conflict
-        for i in range(nthread):
+        for i in range(self.nworker):
             self.blogs.append(nav.Blog(dummy,dummy))
 
     def setup_page(self, blog_path, tid):
@@ -109,23 +156,74 @@ class BlogsGen(object):
         return blog
 
     def start(self):
-        for t in self.workers:
+        if self.mode == 'process' and len(self.toupdate) > 1:
+            self.start_processes()
+        else:
+            self.start_threads()
+        #build catalogs and something else
+
+    def start_threads(self):
+        workers = [self.BlogBuilder(self, i) for i in range(self.nworker)]
+        for t in workers:
             t.start()
-        for t in self.workers:
+        for t in workers:
             t.join()
-        #build catalogs and something else
+
+    def start_processes(self):
+        """
+        hand the blogs to a pool of processes in batches, every process holds
+        its own BlogsGen, so markdown and jinja states are never shared.
+        """
+        own_pool = self.pool is None
+        pool = self.pool or open_pool(self.config, self.nworker)
+        try:
+            for done in pool.imap_unordered(_build_batch, self.get_batches()):
+                for blog_path, attrs in done:
+                    self.done_work(blog_path, attrs)
+        except:
+            pool.terminate()
+            raise
+        finally:
+            if own_pool:
+                pool.close()
+                pool.join()
+
+    def get_batches(self):
+        """
+        split the blogs to compile into batches, small enough to keep every
+        process busy until the end, large enough to amortize the ipc.
+        """
+        blog_paths = list(self.toupdate)
+        size = max(1, min(64, len(blog_paths) // (self.nworker * 4)))
+        batches = []
+        for i in range(0, len(blog_paths), size):
+            batch = blog_paths[i:i+size]
+            digests = dict((blog_path, self.output_digests.get(blog_path))
+                    for blog_path in batch)
+            batches.append((batch, digests))
+        return batches
 
     def get_work(self):
         return self.toupdate.pop()
     def done_work(self, blog_path, attrs):
+        if not attrs:
+            return
         info = []
         info.append(attrs['page_title'])
         info.append(attrs['page_date'] )
         info.append(attrs['page_tags'] )
         self.updated[blog_path] = info
+        if self.record is not None:
+            previous = self.record.put(blog_path, info,
+                    attrs.get('page_sort_key'), attrs.get('excerpt'))
+            if previous is not None:
+                self.previous[blog_path] = previous
+        self.deps[blog_path] = attrs.get('deps')
+        self.output_hashes[blog_path] = attrs.get('output_hash')
+        self.written.add('written' if attrs['written'] else 'unchanged')
 
     def build_blog(self, blog,site_navigation):
-        wanted_attrs = ['page_date', 'page_title', 'page_tags']
+        wanted_attrs = ['page_date', 'page_title', 'page_tags', 'page_sort_key']
         unwanted_attrs = ['toc']
         return self._build_blog(blog, self.config, site_navigation,
                 wanted_attrs, unwanted_attrs)
@@ -148,18 +246,37 @@ class BlogsGen(object):
 
         extens = config['markdown_extensions']
 
+        linked, refs, anchors = [], [], []
         html_content, toc, meta = parser.convert_markdown(
             input_content, page=blog,
-            extensions=extens, strict=config['strict'])
+            extensions=extens, strict=config['strict'], linked=linked,
+            cache=self.cache, links=self.links, refs=refs, anchors=anchors,
+            backend=config.get('markdown_backend'),
+            excerpt_paragraphs=config.get('excerpt_paragraphs'))
         #every thread has its our context
         context = get_global_blog_context(blog, site_navigation, config)
         context.update(BLANK_BLOG_CONTEXT)
         context.update(get_blog_context(config, html_content, toc, meta))
         context.update({'structure' : 'blog.html'})
 
+        #the index shows the excerpt, with the urls relative to the top, it
+        #is kept in the record
+        prefix = os.path.join(config['site_dir'],
+                os.path.dirname(blog.input_path))
+        excerpt = parser.render_excerpt(prefix)
+        if excerpt is None:
+            excerpts = []
+            parser.convert_markdown(input_content, page=blog,
+                    extensions=extens, strict=config['strict'],
+                    prefix=prefix, cache=self.cache, links=self.links,
+                    backend=config.get('markdown_backend'),
+                    excerpt_paragraphs=config.get('excerpt_paragraphs'),
+                    excerpts=excerpts)
+            excerpt = excerpts[0]
+
         #get what users wanted and remove want users dont wanted
         #so in general, toc is removed
-        output_attrs = {}
+        output_attrs = {'excerpt': excerpt}
         for i in wanted_attrs:
             output_attrs[i] = context.get(i)
         for i in unwanted_attrs:
@@ -168,35 +285,86 @@ class BlogsGen(object):
             context[i] = None
 
         #Allow 'template:' override in md source files.
-        if 'template' in meta:
-            template = self.env.get_template(meta['template'][0])
-        else:
-            template = self.env.get_template('base.html')
+        with self.env.record_templates() as templates:
+            if 'template' in meta:
+                template = self.env.get_template(meta['template'][0])
+            else:
+                template = self.env.get_template('base.html')
+
+            # Render the template.
+            final_content =  template.render(context)
+        output_attrs['deps'] = {
+            'templates': list(templates),
+            'links': linked,
+            'refs': refs,
+            'anchors': anchors,
+        }
+        #just write right in the directory, unless nothing changed
+        final_content = final_content.encode('utf8')
+        output_attrs['output_hash'] = utils.content_digest(final_content)
+        output_attrs['written'] = utils.write_file(final_content, output_path,
+                self.output_digests.get(blog.input_path))
 
-        # Render the template.
-        final_content =  template.render(context)
-        #just write right in the directory
+        return output_attrs
 
-        with open(output_path, 'w') as f:
-            f.write(final_content.encode('utf8'))
-            f.close()
 
-        return output_attrs
+#every worker process holds one BlogsGen, set up by the pool initializer
+_process_gen = None
+
+
+def open_pool(config, nworker=None):
+    """
+    start the processes compiling blogs. Processes are forked, so open the
+    pool before starting any other thread.
+    """
+    return Pool(nworker or num_of_workers(config), _init_process, (config,))
+
+
+def _init_process(config):
+    global _process_gen
+    site_navigation = nav.SiteNavigation(config['pages'])
+    _process_gen = BlogsGen(config, [], site_navigation, nworker=1)
+
+
+def _build_batch(args):
+    """
+    compile a batch of blogs in a worker process, return the attrs of every
+    blog so the parent can merge them with done_work
+    """
+    batch, output_digests = args
+    _process_gen.output_digests = output_digests
+    if _process_gen.links is None:
+        _process_gen.links = source_links(_process_gen.config)
+    done = []
+    for blog_path in batch:
+        blog = _process_gen.setup_page(blog_path, 0)
+        try:
+            attrs = _process_gen.build_blog(blog, _process_gen.site_navigation)
+        except Exception:
+            log.exception('Error building blog %s', blog_path)
+            continue
+        done.append((blog_path, attrs))
+    return done
+
+
+def source_links(config, sources=None):
+    """
+    the LinkIndex of the markdown files of the docs dir, @sources if they were
+    walked already, and of the pages
+    """
+    if sources is None:
+        sources = [f for f, st in walk_sources(config['docs_dir'],
+            config['pages'])]
+    files = [f.replace(os.sep, '/') for f in sources]
+    files.extend(utils.exact_page_config(page)[0] for page in config['pages'])
+    return LinkIndex(files)
 
 
 def get_blog_context(config, html, toc, meta):
     """
     update a blogs' page context
     """
-    try:
-        title = (meta.get('title') or meta.get('Title'))[0]
-        date = (meta.get('date') or meta.get('Date'))[0]
-    except:
-        raise NameError('Error in retrieving blogs meta')
-    date = utils.parse_date(date)
-    tags = meta.get('tags') or meta.get('Tags')
-    if not tags:
-        tags = ['NO TAGS']
+    (title, date, tags), sort_key = meta_entry(meta)
 
     return {
             #there is no next page and previous page for blo
@@ -205,81 +373,134 @@ def get_blog_context(config, html, toc, meta):
             'meta' : meta,
             'page_title' : title,
             'page_date' : date,
+            'page_sort_key' : sort_key,
             'page_tags' : tags
             }
 
-def read_ignore(ignored_file):
-    ignored_list = []
-    if not os.path.isfile(ignored_file):
-        pass
-    else:
-        with open(ignored_file) as f:
-            for line in f:
-                ignored_files.append(line)
-            f.close()
-    return ignored_list
-
-
-def get_toupdate(directory, config):
-    #TODO:in the future version, we will allowed tree directory, using BFS
-    dot_ignore = '.ignore'
-    ignored_files = read_ignore(os.path.join(directory,\
-        dot_ignore))
-    ignored_files.append(dot_ignore)
-
-    markdown_list = {}
-    html_list = {}
+def get_toupdate(directory, config, manifest, sources=None):
+    """
+    return the blogs under @directory which need building, every blog found
+    is appended to @sources
+    """
     toupdate = []
-    for f in os.listdir(directory):
-        f_abs = os.path.join(directory, f)
-        if f == dot_ignore:
-            continue
-        if f in ignored_files:
-            continue
-        if utils.is_page(f_abs, config['pages']):
-            continue
-        if os.path.isdir(f_abs):
-            continue
-        if utils.is_newmd(f_abs):   #change is to is new_md
+    for f, st in walk_sources(directory, config['pages'], manifest,
+            config.get('prune_unchanged_dirs')):
+        if sources is not None:
+            sources.append(f)
+        if st is None:
+            fresh = manifest.built_fresh(f)
+        else:
+            fresh = manifest.is_fresh(f, st)
+        if not fresh:
             toupdate.append(f)
 
     return toupdate
 
-def build_blogs(config, site_navigation):
+def open_manifest(config):
+    dot_manifest = config.get('dot_manifest') or '.manifest'
+    return BuildManifest(os.path.join(config['docs_dir'], dot_manifest),
+            config['docs_dir'],
+            config_digest=config_fingerprint(config, BLOG_CONFIG_KEYS))
+
+
+def build_blogs(config, site_navigation, record, pool=None, manifest=None):
     """
-    build blogs and generate enough information for build pages
+    build blogs and generate enough information for build pages, the blog
+    @record is kept open for them, the caller closes it
     """
     topn = config.get('n_blogs_to_show') or 5
-    dot_record = config.get('dot_record') or '.record'
+    own_manifest = manifest is None
+    manifest = manifest or open_manifest(config)
 
     #XXX:Step 1, get blog record, you will need it for updating catalogs
-    blog_record = utils.load_json(os.path.join(config['docs_dir'],dot_record))
-
-    #XXX: Step 2, build all the blogs
-    #FIXME: Fix this, if @blog_record is in anyway, missing something, the
-    #generated catalog is incompleted
-    toupdate = get_toupdate(config['docs_dir'], config)
-    compiler = BlogsGen(config, toupdate, site_navigation)
+    old_index = record.top(topn)
+    recorded = record.paths()
+
+    #XXX: Step 2, build all the blogs, the ones up to date but missing from
+    #the record only need their meta read
+    sources = []
+    toupdate = get_toupdate(config['docs_dir'], config, manifest, sources)
+    missing = {}
+    for blog_path in set(sources) - recorded - set(toupdate):
+        try:
+            missing[blog_path] = meta_entry(read_meta(
+                os.path.join(config['docs_dir'], blog_path)))
+        except (NameError, ValueError, IOError, UnicodeDecodeError):
+            # the build reports what is wrong with it
+            toupdate.append(blog_path)
+    output_digests = dict((blog_path, manifest.output_digest(blog_path))
+            for blog_path in toupdate)
+    config['link_index'] = links = source_links(config, sources)
+    compiler = BlogsGen(config, toupdate, site_navigation, pool=pool,
+            output_digests=output_digests, record=record, links=links)
     compiler.start()
-
-    #XXX: Step 3, merge compiler.updated with dot_record
-    blog_record.update(compiler.updated)
-    utils.write_json(os.path.join(config['docs_dir'],dot_record), blog_record)
+    stats = config.get('build_stats')
+    if stats:
+        stats.add('written', compiler.written['written'])
+        stats.add('unchanged', compiler.written['unchanged'])
+
+    #XXX: Step 3, the record got the updates of the blogs compiled, drop the
+    #blogs removed, remember what the blogs were built from
+    delta = record_delta(compiler.previous, compiler.updated)
+    for blog_path, (entry, sort_key) in missing.items():
+        record.put(blog_path, entry, sort_key)
+        delta[blog_path] = (None, entry)
+    for blog_path in recorded - set(sources):
+        delta[blog_path] = (record.remove(blog_path), None)
+        manifest.forget(blog_path)
+    record.commit()
+    for blog_path in compiler.updated.keys():
+        manifest.record(blog_path, utils.get_html_path(blog_path),
+                compiler.deps[blog_path], compiler.output_hashes[blog_path])
+    if own_manifest:
+        manifest.save()
 
     #XXX: Step 4, generate catalogs and index
-    config['catalist'] = gen_catalist(blog_record)
-    config['blogs_on_index'] = utils.sort_blogs(blog_record)[:topn]
-
-def gen_catalist(record):
-    cata_list = {}
-    for key in record.keys():
-        tags = (record[key])[-1]
-        for tag in tags:
-            if not cata_list.get(tag):
-                cata_list[tag] = [(record[key][0], key)]
-            else:
-                cata_list[tag].append((record[key][0], key))
-    return cata_list
+    config['catalist'] = record.catalog()
+    config['blogs_on_index'] = record.top(topn)
+    config['record_store'] = record
+
+    #XXX: Step 5, find out which generated pages the changes reach, a
+    #changed page loses its manifest entry until it is built again
+    config['dirty_pages'] = dirty_pages(delta, old_index,
+            config['blogs_on_index'], compiler.updated.keys())
+    if (len(recorded) > topn) != (len(record) > topn):
+        # the index links to its second page only if there is one
+        config['dirty_pages'].add('Home')
+    config['touched_tags'] = touched_tags(delta)
+    config['changed_blogs'] = set(delta)
+    for title, output in (('Home', 'index.html'), ('Catalogs', 'catalog.html')):
+        if title in config['dirty_pages']:
+            manifest.forget_generated(output)
+
+
+def record_delta(old, new):
+    """
+    the blogs whose record entry differs between @old and @new,
+    path -> (old entry, new entry), the entry is None for added or removed
+    blogs
+    """
+    delta = {}
+    for blog_path in set(old) | set(new):
+        if old.get(blog_path) != new.get(blog_path):
+            delta[blog_path] = (old.get(blog_path), new.get(blog_path))
+    return delta
+
+
+def dirty_pages(delta, old_index, new_index, rebuilt):
+    """
+    titles of the generated pages whose content changed: the catalog lists
+    the title of every blog under its tags, the index shows the top blogs
+    """
+    dirty = set()
+    for old, new in delta.values():
+        if not old or not new or old[0] != new[0] or old[2] != new[2]:
+            dirty.add('Catalogs')
+            break
+    if old_index != new_index or set(new_index) & set(rebuilt):
+        dirty.add('Home')
+    return dirty
+
 
 def build(config, live_server=False, clean_site_dir=False):
     """
@@ -293,24 +514,171 @@ def build(config, live_server=False, clean_site_dir=False):
         if not clean_site_dir and site_directory_contains_stale_files(config['site_dir']):
             print("Directory %s contains stale files. Use --clean to remove them." % config['site_dir'])
 
-    #switch the build sequence, so that we can build catalist and index along
-    #with pages
-    site_navigation = nav.SiteNavigation(config['pages'])
-    log.debug("Building blogs.")
-    build_blogs(config, site_navigation)
-    log.debug("Building markdown pages.")
-    build_pages(config, site_navigation)
+    #only the index and the catalog need the merged blog record, everything
+    #else runs along with the blogs. Every stage renders with its own site
+    #navigation, as the active page of a navigation is shared by its renders.
+    pages = config['pages']
+    # an unknown markdown backend stops the build here, not in every blog
+    parser.get_backend(config.get('markdown_backend'),
+            config['markdown_extensions'])
+    # the workers of the pool are forked with the environment of the build
+    env = get_environment(config, new_session=True)
+    manifest = open_manifest(config)
+    pool = None
+    if config.get('build_mode') == 'process':
+        pool = open_pool(config)
+    config['build_stats'] = stats = utils.AtomicCounter()
+    config['link_graph'] = LinkGraph()
+    record = open_record(config)
+    # in strict mode a broken link stops the build before the pages made of
+    # the blogs
+    after_blogs = ['blogs', 'links'] if config.get('strict') else ['blogs']
+
+    graph = TaskGraph()
+    graph.add('blogs', build_blogs,
+            (config, nav.SiteNavigation(pages), record, pool, manifest))
+    graph.add('pages', build_static_pages,
+            (config, set_builders(nav.SiteNavigation(pages)), env))
+    graph.add('404', build_404,
+            (config, env, nav.SiteNavigation(pages)))
+    graph.add('links', check_links, (config, manifest),
+            deps=['blogs', 'pages'])
+    graph.add('index', build_generated_page,
+            ('Home', config, set_builders(nav.SiteNavigation(pages)), env,
+                manifest),
+            deps=after_blogs)
+    graph.add('catalog', build_generated_page,
+            ('Catalogs', config, set_builders(nav.SiteNavigation(pages)), env,
+                manifest),
+            deps=after_blogs)
+    graph.add('tags', build_tag_pages,
+            (config, nav.SiteNavigation(pages), env, manifest),
+            deps=after_blogs)
+    graph.add('archives', build_archives,
+            (config, nav.SiteNavigation(pages), env, manifest),
+            deps=after_blogs)
+    graph.add('theme_media', copy_theme_media, (config,))
+    # compiled blogs are in the docs dir, move them along with the media
+    graph.add('docs_media', copy_docs_media, (config,), deps=after_blogs)
+
+    try:
+        graph.run()
+    except:
+        if pool:
+            pool.terminate()
+        raise
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        # only what was built successfully is in the manifest, the record
+        # changes are dropped unless the blogs were all merged
+        manifest.save()
+        record.close()
+        config.pop('record_store', None)
+        config.pop('link_index', None)
+        config.pop('link_graph', None)
+        cache = open_cache(config)
+        if cache:
+            cache.trim()
+
+    if not live_server:
+        print("Wrote %d files, %d unchanged." % (stats['written'],
+            stats['unchanged']))
+        print("Copied %s of media files, %s unchanged." % (
+            format_size(stats['media_copied']),
+            format_size(stats['media_skipped'])))
+
+
+def _read_entry(args):
+    """
+    (blog path, (entry, sort_key)) of the blog, its entry is None if its meta
+    can't be read
+    """
+    docs_dir, blog_path = args
+    try:
+        return blog_path, meta_entry(read_meta(
+            os.path.join(docs_dir, blog_path)))
+    except (NameError, ValueError, IOError, UnicodeDecodeError):
+        log.error('Cannot read the meta of %s', blog_path)
+        return blog_path, None
+
+
+def reindex(config):
+    """
+    rebuild the record from the meta of the blogs without building them. The
+    meta are read by threads, which mostly wait for the files, or parsed by
+    processes with the 'process' build_mode. The excerpts in the record are
+    kept.
+    """
+    docs_dir = config['docs_dir']
+    sources = [f for f, st in walk_sources(docs_dir, config['pages'])]
+    jobs = [(docs_dir, blog_path) for blog_path in sources]
+    nworker = num_of_workers(config)
 
-    # NOW move compiled blogs along with themes to site dir
+    if config.get('build_mode') == 'process' and len(jobs) > 1:
+        pool = Pool(nworker)
+        try:
+            entries = pool.map(_read_entry, jobs,
+                    max(1, len(jobs) // (nworker * 4)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        entries = utils.run_in_threads(_read_entry, jobs, nworker)
+    record = open_record(config)
+    try:
+        for blog_path in record.paths() - set(sources):
+            record.remove(blog_path)
+        for blog_path, found in entries:
+            if found:
+                record.put(blog_path, *found)
+        record.commit()
+    finally:
+        record.close()
+
+    #XXX: the generated pages were made from the old record, whatever changed
+    #they are built again
+    manifest = open_manifest(config)
+    for output in manifest.generated_outputs():
+        manifest.forget_generated(output)
+    manifest.save()
+    print("Indexed %d blogs." % sum(1 for f, found in entries if found))
+
+
+def format_size(nbytes):
+    for unit in ('bytes', 'KB', 'MB'):
+        if nbytes < 1024:
+            break
+        nbytes /= 1024.0
+    else:
+        unit = 'GB'
+    if unit == 'bytes':
+        return '%d bytes' % nbytes
+    return '%.1f %s' % (nbytes, unit)
+
+
+def copy_media(config, from_dir, to_dir):
+    copied, skipped = utils.copy_media_files(from_dir, to_dir,
+            config.get('media_copy', 'copy'), num_of_workers(config))
+    stats = config.get('build_stats')
+    if stats is not None:
+        stats.add('media_copied', copied)
+        stats.add('media_skipped', skipped)
+
+
+def copy_theme_media(config):
     # Reversed as we want to take the media files from the builtin theme
     # and then from the custom theme_dir so the custom versions take take
     # precedence.
     for theme_dir in reversed(config['theme_dir']):
         log.debug("Copying static assets from theme: %s", theme_dir)
-        utils.copy_media_files(theme_dir, '')
+        copy_media(config, theme_dir, '')
+
 
+def copy_docs_media(config):
     log.debug("Copying static assets from the docs dir.")
-    utils.copy_media_files(config['docs_dir'], config['site_dir'])
+    copy_media(config, config['docs_dir'], config['site_dir'])
 
 
 
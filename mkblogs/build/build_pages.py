@@ -7,19 +7,42 @@ from jinja2.exceptions import TemplateNotFound
 import mkblogs
 from mkblogs import toc, utils
 from mkblogs.compat import urljoin, PY2
+from mkblogs.exceptions import ConfigurationError, MkDocsException
 from mkblogs.build import html as parser
 from mkblogs.build import nav
+from mkblogs.build.manifest import TrackingEnvironment, config_fingerprint
+from mkblogs.build.cache import open_cache, open_bytecode_cache
+from mkblogs.build.precompiled import theme_loader, compile_templates
+from mkblogs.build.record import open_record
 import jinja2
 import json
 import markdown
 import os
 import logging
 import posixpath
+import threading
 
 log = logging.getLogger('mkblogs')
 
 
 
+#everything get_global_context reads from config, outputs rendered with it
+#are rebuilt when one of them changes
+GLOBAL_CONFIG_KEYS = (
+    'site_name', 'site_favicon', 'site_description', 'site_author',
+    'extra_javascript', 'extra_css', 'repo_url', 'repo_name',
+    'include_nav', 'include_next_prev', 'include_search',
+    'copyright', 'google_analytics',
+)
+
+#the generated pages also read the navigation, the markdown settings and how
+#many blogs go to the index
+PAGE_CONFIG_KEYS = GLOBAL_CONFIG_KEYS + (
+    'pages', 'site_url', 'markdown_extensions', 'markdown_backend', 'strict',
+    'docs_dir', 'site_dir', 'n_blogs_to_show', 'tags_dir',
+    'excerpt_paragraphs',
+)
+
 
 def get_global_context(page, nav, config):
     """
@@ -115,27 +138,53 @@ def get_page_context(page, content, toc, meta, config):
         'next_page': page.next_page,
     }
 
-def add_category(key):
-    return "### Category-{0}\n".format(key.encode('utf8'))
-def add_cate_blog(blog, path):
-    return "+ [{0}]({1})\n".format(blog.encode('utf8'), path.encode('utf8'))
+def write_output(config, content, output_path, known_digest=None):
+    """
+    write a rendered page unless it is unchanged, and count it in
+    config['build_stats']
+    """
+    written = utils.write_file(content, output_path, known_digest)
+    stats = config.get('build_stats')
+    if stats:
+        stats.add('written' if written else 'unchanged')
+    return written
+
 
 def build_catalog(page, config, site_navigation, env):
     """
-    write the top catalog page for blogs according to catalist.
+    render the catalog page, every tag with the blogs under it, straight
+    from the tag index
     """
-    catalist = config['catalist']
-    input_path = page.input_path
-    with open(input_path, 'w') as f:
-        for key in catalist.keys():
-            f.write(add_category(key))
-            for (blog_name, blog_path) in catalist[key]:
-                """hard code the blog addr to its html addr, fix this later"""
-                blog_url = os.path.join(config['site_dir'],
-                        utils.get_html_path(blog_path))
-                f.write(add_cate_blog(blog_name, blog_url))
-        f.close()
-    _build_page(page, config, site_navigation, env)
+    catalist = config.get('catalist')
+    if catalist is None:
+        catalist = (config.get('record_store') or open_record(config)).catalog()
+    tags_dir = config.get('tags_dir') or 'tags'
+    url_context = page.url_context
+
+    catalog = []
+    for tag in sorted(catalist):
+        blogs = []
+        for (blog_name, blog_path) in catalist[tag]:
+            blog_url = '/' + os.path.join(config['site_dir'],
+                    utils.get_html_path(blog_path))
+            blogs.append({
+                'title': blog_name,
+                'url': url_context.make_relative(blog_url),
+            })
+        catalog.append({
+            'tag': tag,
+            'url': url_context.make_relative('/' + tag_page_path(tag, 1,
+                tags_dir)),
+            'blogs': blogs,
+        })
+
+    context = get_global_context(page, site_navigation, config)
+    context.update(get_page_context(page, None, None, None, config))
+    context.update({'structure': 'catalog.html', 'catalog': catalog})
+
+    template = env.get_template('base.html')
+    output_content = template.render(context)
+    write_output(config, output_content.encode('utf-8'), page.output_path)
 
 
 #XXX:fixed
@@ -152,7 +201,7 @@ def build_404(config, env, site_navigation):
     global_context.update(get_page_context(page, None, None, None, config))
 
     output_content = template.render(global_context)
-    utils.write_file(output_content.encode('utf-8'), '404.html')
+    write_output(config, output_content.encode('utf-8'), '404.html')
 
 def get_blog_meta(data):
     #TODO: either we change the template or blog_record file format
@@ -166,8 +215,7 @@ def build_index(page, config, site_navigation, env):
     """
     the blogs_on_index is a list of name of blogs, under docs/
     """
-    dot_record = config.get('dot_record') or '.record'
-    blog_record = utils.load_json(os.path.join(config['docs_dir'],dot_record))
+    record = config.get('record_store') or open_record(config)
 
     template = env.get_template('base.html')
 
@@ -176,32 +224,60 @@ def build_index(page, config, site_navigation, env):
     topblogs = []
 
     newblogs = config['blogs_on_index']
+    cache = open_cache(config)
+    #the excerpts are kept in the record, a blog not built since the record
+    #had excerpts is converted here, once
+    excerpts = record.excerpts(newblogs)
+    made = False
     for blog_path in newblogs:
-        try:
-            input_content = open(os.path.join(config['docs_dir'], blog_path),'r').read()
-        except:
-            log.error('failed to generate index from %s', blog_path)
-            continue
-        if PY2:
-            input_content = input_content.decode('utf-8')
-
-        newblog = nav.Blog(utils.get_url_path(blog_path), blog_path)
-        prefix=os.path.join(config['site_dir'], os.path.dirname(blog_path))
-        html_content, table_of_contents, meta = parser.convert_markdown(
-            input_content, newblog,
-            extensions=config['markdown_extensions'],
-            strict=config['strict'],
-            prefix=prefix)
-
-        blog_meta = get_blog_meta(blog_record[blog_path])
+        excerpt = excerpts.get(blog_path)
+        if excerpt is None:
+            excerpt = convert_index_excerpt(blog_path, config, cache)
+            if excerpt is None:
+                continue
+            record.set_excerpt(blog_path, excerpt)
+            made = True
+
+        blog_meta = get_blog_meta(record.get(blog_path))
         blog_meta['url'] = os.path.join(config['site_dir'], utils.get_html_path(blog_path))
-        blog_meta['content'] = html_content
+        blog_meta['content'], blog_meta['more'] = excerpt
         topblogs.append(blog_meta)
         #get their attributes
+    if made:
+        record.commit()
     context['topblogs'] = topblogs
+    if len(record) > len(newblogs):
+        # the older blogs are on the pages of build_archives
+        context['next_url'] = page.url_context.make_relative('/page/2.html')
 
     output_content = template.render(context)
-    utils.write_file(output_content.encode('utf-8'), 'index.html')
+    write_output(config, output_content.encode('utf-8'), 'index.html')
+
+def convert_index_excerpt(blog_path, config, cache=None):
+    """
+    the (html, more) of the excerpt of a blog as shown on the index, for the
+    blogs whose excerpt isn't in the record
+    """
+    try:
+        input_content = open(os.path.join(config['docs_dir'], blog_path),'r').read()
+    except:
+        log.error('failed to generate index from %s', blog_path)
+        return None
+    if PY2:
+        input_content = input_content.decode('utf-8')
+
+    newblog = nav.Blog(utils.get_url_path(blog_path), blog_path)
+    prefix=os.path.join(config['site_dir'], os.path.dirname(blog_path))
+    excerpts = []
+    parser.convert_markdown(
+        input_content, newblog,
+        extensions=config['markdown_extensions'],
+        strict=config['strict'],
+        prefix=prefix, cache=cache, links=config.get('link_index'),
+        backend=config.get('markdown_backend'),
+        excerpt_paragraphs=config.get('excerpt_paragraphs'),
+        excerpts=excerpts)
+    return excerpts[0]
 
 #XXX:fixed
 def _build_page(page, config, site_navigation, env):
@@ -219,10 +295,17 @@ def _build_page(page, config, site_navigation, env):
         input_content = input_content.decode('utf-8')
 
     # Process the markdown text
+    refs, anchors = [], []
     html_content, table_of_contents, meta = parser.convert_markdown(
         input_content, page,
-        extensions=config['markdown_extensions'], strict=config['strict']
+        extensions=config['markdown_extensions'], strict=config['strict'],
+        cache=open_cache(config), refs=refs, anchors=anchors,
+        backend=config.get('markdown_backend')
     )
+    # the links are checked once everything is built
+    if config.get('link_graph') is not None:
+        config['link_graph'].add(page.file_context.current_file, refs,
+                anchors)
 
     context = get_global_context(page, site_navigation, config)
     context.update(get_page_context(
@@ -239,28 +322,170 @@ def _build_page(page, config, site_navigation, env):
     output_content = template.render(context)
 
     # Write the output file.
-    utils.write_file(output_content.encode('utf-8'), output_path)
+    write_output(config, output_content.encode('utf-8'), output_path)
 
-#XXX:fixed
-def build_pages(config, site_navigation):
+def tag_page_path(tag, number=1, tags_dir='tags'):
+    """
+    the output path of the page @number of the pages of @tag
+    """
+    if number == 1:
+        return '%s/%s.html' % (tags_dir, utils.tag_slug(tag))
+    return '%s/%s-%d.html' % (tags_dir, utils.tag_slug(tag), number)
+
+
+def year_page_path(year, number=1):
+    """
+    the output path of the page @number of the archive of @year
+    """
+    if number == 1:
+        return '%04d/index.html' % year
+    return '%04d/page/%d.html' % (year, number)
+
+
+def month_page_path(year, month, number=1):
     """
-    Builds all the pages and writes them into the build directory.
+    the output path of the page @number of the archive of @month of @year
     """
-    #site_navigation = nav.SiteNavigation(config['pages'])
-    loader = jinja2.FileSystemLoader(config['templates_dir'])
-    env = jinja2.Environment(loader=loader)
+    if number == 1:
+        return '%04d/%02d/index.html' % (year, month)
+    return '%04d/%02d/page/%d.html' % (year, month, number)
 
+
+def month_page(date):
+    """
+    the output path of the archive of the month of the blog @date
+    """
+    try:
+        date = utils.to_datetime(date)
+    except (ValueError, OverflowError, AttributeError):
+        # no archive has the blogs with a date we can't read
+        return 'index.html'
+    return month_page_path(date.year, date.month)
+
+
+#the environments made by get_environment, by what they are made of
+_environments = {}
+_environments_lock = threading.Lock()
+
+
+def get_environment(config, new_session=False):
+    """
+    The jinja2 environment rendering with the templates of @config. There is
+    one for the same templates, tags dir, cache and compiled theme, shared by
+    everything rendered, and by the rebuilds of `serve`, so a template is
+    compiled once, or loaded from the compiled theme when it is up to date,
+    or from the bytecode cache in the cache dir.
+
+    The templates are not checked for changes while they are used
+    (auto_reload is off), @new_session forgets the templates loaded, at the
+    start of a build, the ones changed since are compiled again.
+    """
+    templates_dir = config['templates_dir']
+    if not isinstance(templates_dir, (list, tuple)):
+        templates_dir = [templates_dir]
+    cache_dir = config.get('cache_dir')
+    compiled_theme = config.get('compiled_theme')
+    key = (tuple(os.path.abspath(path) for path in templates_dir),
+            config.get('tags_dir') or 'tags',
+            cache_dir and os.path.abspath(cache_dir),
+            compiled_theme and os.path.abspath(compiled_theme))
+
+    with _environments_lock:
+        env = _environments.get(key)
+        if env is None:
+            env = make_environment(config, theme_loader(config),
+                    open_bytecode_cache(config))
+            _environments[key] = env
+        elif new_session:
+            env.loader = theme_loader(config, env.loader)
+            if env.cache is not None:
+                env.cache.clear()
+    return env
+
+
+def make_environment(config, loader, bytecode_cache=None):
+    """
+    a new jinja2 environment rendering the templates of @loader for @config
+    """
+    env = TrackingEnvironment(loader=loader, auto_reload=False,
+            bytecode_cache=bytecode_cache)
+    # {{ base_url }}/{{ tag|tag_page }} links a tag to its page
+    tags_dir = config.get('tags_dir') or 'tags'
+    env.filters['tag_page'] = lambda tag: tag_page_path(tag, 1, tags_dir)
+    # {{ base_url }}/{{ date|month_page }} links a date to its month
+    env.filters['month_page'] = month_page
+    return env
+
+
+def compile_theme(config):
+    """
+    compile the templates of @config ahead of time to 'compiled_theme', the
+    builds load them from there until they change
+    """
+    target = config.get('compiled_theme')
+    if not target:
+        raise ConfigurationError("Set 'compiled_theme' to the file to "
+                "compile the theme to")
+    env = make_environment(config,
+            jinja2.FileSystemLoader(config['templates_dir']))
+    try:
+        count = compile_templates(env, target)
+    except jinja2.TemplateSyntaxError as e:
+        raise MkDocsException("Cannot compile the template %s, line %s: %s"
+                % (e.filename or e.name, e.lineno, e.message))
+    print("Compiled %d templates to %s" % (count, target))
+
+
+def set_builders(site_navigation):
+    """
+    the Home and Catalogs pages are generated from the blogs instead of being
+    compiled from markdown, set their builders. Returns @site_navigation.
+    """
     index = site_navigation.get_page('Home')
     index.set_builder(build_index)
     catalist = site_navigation.get_page('Catalogs')
     catalist.set_builder(build_catalog)
-    build_404(config, env, site_navigation)
+    return site_navigation
 
+
+def build_generated_page(title, config, site_navigation, env, manifest=None):
+    """
+    build the generated page @title, it needs the blogs built already. With a
+    @manifest, the page is skipped when the blogs didn't change its content
+    (it is not in config['dirty_pages']) and its templates and config are
+    the same as last build.
+    """
+    page = site_navigation.get_page(title)
+    config_digest = config_fingerprint(config, PAGE_CONFIG_KEYS)
+    if manifest and title not in config.get('dirty_pages', (title,)) and \
+            manifest.generated_fresh(page.output_path, config_digest):
+        log.debug("Page %s is up to date", page.input_path)
+        return
+
+    log.debug("Building page %s", page.input_path)
+    page.set_active()
+    try:
+        with env.record_templates() as templates:
+            page.get_builder()(page, config, site_navigation, env)
+    except:
+        log.error("Error building page %s", page.input_path)
+        raise
+    finally:
+        page.set_active(False)
+    if manifest:
+        manifest.record_generated(page.output_path, config_digest, templates)
+
+
+def build_static_pages(config, site_navigation, env):
+    """
+    build the pages written by users, they don't need anything from blogs
+    """
     for page in site_navigation.walk_pages():
+        if page.get_builder():
+            continue
         try:
             log.debug("Building page %s", page.input_path)
-            build_page = page.get_builder() or _build_page
-            build_page(page, config, site_navigation, env)
+            _build_page(page, config, site_navigation, env)
         except:
             log.error("Error building page %s", page.input_path)
             raise
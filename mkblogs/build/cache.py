@@ -0,0 +1,263 @@
+# coding: utf-8
+
+"""
+An on-disk cache of converted markdown.
+
+A fragment is what convert_markdown makes of a source: the html, the meta,
+its links, anchors, headings and excerpt. It is stored under the digest of
+everything it was made from (the source, the markdown extensions and their
+config, the versions of mkblogs and markdown, the markdown backend, where the
+page is placed, the length of excerpts), so an entry never goes stale, it
+only goes unused. Rebuilding after
+a template change, or in a CI job restoring the cache directory, skips the
+markdown parsing.
+
+Entries are written to a temporary file then renamed, so the threads and
+processes of a build can share the cache. Reading an entry updates its mtime,
+trim() removes the least recently used entries above the size limit. Writing
+an entry leaves a '.written' file at the top of the cache, trim() does nothing
+without it, so a build writing nothing doesn't list the cache.
+
+The html of highlighted code blocks is kept in the 'highlight' directory of
+the cache, under the digest of the language, the code and the options of the
+formatter, see HighlightCache. A snippet edited or new is highlighted, the
+others are not, whichever posts they are in.
+
+The compiled templates are kept in the 'jinja' directory, see
+open_bytecode_cache, a build loads them instead of compiling the templates
+again unless their source changed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import jinja2
+import markdown
+
+import mkblogs
+from mkblogs.build.excerpt import EXCERPT_PARAGRAPHS
+
+log = logging.getLogger('mkblogs')
+
+
+WRITTEN_MARKER = '.written'
+
+
+def mark_written(directory):
+    """
+    note that an entry was written to the cache @directory since it was
+    trimmed
+    """
+    path = os.path.join(directory, WRITTEN_MARKER)
+    if os.path.exists(path):
+        return
+    try:
+        open(path, 'a').close()
+    except (IOError, OSError):
+        log.debug("Cannot write %s", path, exc_info=True)
+
+
+def extension_key(extension):
+    """
+    a stable description of a markdown extension, named or an instance
+    """
+    if isinstance(extension, markdown.Extension):
+        return '%s.%s%r' % (extension.__class__.__module__,
+                extension.__class__.__name__,
+                sorted(extension.getConfigs().items()))
+    return repr(extension)
+
+
+class FragmentCache(object):
+    def __init__(self, directory, max_size=None, root=None):
+        """
+        @max_size is the size limit in bytes, None for no limit, @root the
+        top of the cache @directory is in, itself by default
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.root = root or directory
+        self._highlights = None
+
+    @property
+    def highlights(self):
+        """
+        the HighlightCache in this cache, trimmed along with it
+        """
+        if self._highlights is None:
+            self._highlights = HighlightCache(
+                    os.path.join(self.directory, 'highlight'),
+                    root=self.root)
+        return self._highlights
+
+    def key(self, source, extensions=(), page=None, strict=False, prefix=None,
+            backend='markdown', excerpt_paragraphs=EXCERPT_PARAGRAPHS):
+        parts = [
+            mkblogs.__version__,
+            markdown.version,
+            [extension_key(ext) for ext in extensions],
+            strict,
+            prefix,
+            excerpt_paragraphs,
+        ]
+        if backend != 'markdown':
+            parts.append(backend)
+        if page is not None:
+            # relative urls depend on where the page and its output are
+            parts.append(page.file_context.current_file)
+            parts.append(page.url_context.base_path)
+        text = json.dumps(parts) + '\n' + source
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key):
+        """
+        the fragment stored under @key, a dict with 'html', 'meta', 'linked',
+        'refs', 'anchors', 'headings', 'excerpt' and 'more', None if there is
+        none
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                fragment = json.loads(f.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return fragment
+
+    def put(self, key, fragment):
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        except OSError:
+            # made by another worker meanwhile
+            if not os.path.isdir(directory):
+                raise
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(fragment).encode('utf-8'))
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            log.debug("Cannot write cache entry %s", path, exc_info=True)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        mark_written(self.root)
+
+    def trim(self):
+        """
+        remove the least recently used entries until the cache fits in its
+        size limit, return the number of entries removed. Nothing is done if
+        no entry was written since the last trim.
+        """
+        marker = os.path.join(self.directory, WRITTEN_MARKER)
+        if not self.max_size or not os.path.exists(marker):
+            return 0
+        try:
+            os.remove(marker)
+        except OSError:
+            pass
+        entries = []
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.startswith('.'):
+                    # the marker, or an entry being written
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        removed = 0
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+
+class HighlightCache(FragmentCache):
+    """
+    the html of highlighted code blocks, entries are dicts with the 'html'
+    """
+    def key(self, lang, code, options):
+        parts = [
+            pygments_version(),
+            lang,
+            sorted(options.items()),
+        ]
+        text = json.dumps(parts) + '\n' + code
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def pygments_version():
+    try:
+        import pygments
+    except ImportError:
+        return None
+    return pygments.__version__
+
+
+class BytecodeCache(jinja2.FileSystemBytecodeCache):
+    """
+    FileSystemBytecodeCache noting what it writes in the cache @root
+    """
+    def __init__(self, directory, root):
+        jinja2.FileSystemBytecodeCache.__init__(self, directory)
+        self.root = root
+
+    def dump_bytecode(self, bucket):
+        jinja2.FileSystemBytecodeCache.dump_bytecode(self, bucket)
+        mark_written(self.root)
+
+
+def open_bytecode_cache(config):
+    """
+    the jinja2 FileSystemBytecodeCache in the cache of @config, None if the
+    cache is disabled
+    """
+    if not config.get('cache_dir'):
+        return None
+    directory = os.path.join(config['cache_dir'], 'jinja')
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            log.debug("Cannot make the template cache %s", directory,
+                    exc_info=True)
+            return None
+    return BytecodeCache(directory, config['cache_dir'])
+
+
+def open_cache(config):
+    """
+    the FragmentCache set up by @config, None if it is disabled
+    """
+    if not config.get('cache_dir'):
+        return None
+    max_size = config.get('cache_size')
+    if max_size:
+        # a string when it comes from the command line
+        max_size = int(float(max_size) * 1024 * 1024)
+    return FragmentCache(config['cache_dir'], max_size)
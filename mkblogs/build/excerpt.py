@@ -0,0 +1,69 @@
+# coding: utf-8
+
+"""
+The excerpts of the blogs, what the index shows of them.
+
+The excerpt of a blog is the blocks of its body before a `<!-- more -->`
+marker, or up to its 'excerpt_paragraphs'-th paragraph if it has no marker.
+It is cut from the tree the blog is converted to, so getting it costs no
+conversion, and kept in the record with the urls relative to the top of the
+site, the index is rendered from the record without converting any blog.
+"""
+
+import re
+
+from markdown.util import HTML_PLACEHOLDER_RE
+
+MORE_RE = re.compile(r'^\s*<!--\s*more\s*-->\s*$', re.IGNORECASE)
+
+EXCERPT_PARAGRAPHS = 3
+
+
+def is_more(html):
+    """
+    whether the raw @html is the marker ending an excerpt
+    """
+    return MORE_RE.match(html) is not None
+
+
+def block_kind(md, element):
+    """
+    'p' if the top level @element of a document converted by @md is a
+    paragraph, 'more' if it is the marker, None else
+    """
+    if element.tag != 'p':
+        return None
+    text = (element.text or '').strip()
+    m = HTML_PLACEHOLDER_RE.match(text)
+    if m and m.group(0) == text and not len(element):
+        # a block of raw html
+        try:
+            raw = md.htmlStash.rawHtmlBlocks[int(m.group(1))]
+        except (IndexError, TypeError):
+            return None
+        if isinstance(raw, tuple):
+            raw = raw[0]
+        return 'more' if is_more(raw) else None
+    return 'p'
+
+
+def excerpt_cut(blocks, paragraphs=EXCERPT_PARAGRAPHS):
+    """
+    Return (length, more), the number of leading @blocks in the excerpt and
+    whether the document goes on after it. @blocks are the block_kind of the
+    top level elements, @paragraphs None or 0 for no limit.
+    """
+    blocks = list(blocks)
+    length = len(blocks)
+    if 'more' in blocks:
+        length = blocks.index('more')
+    elif paragraphs:
+        count = 0
+        for i, kind in enumerate(blocks):
+            if kind == 'p':
+                count += 1
+                if count == paragraphs:
+                    length = i + 1
+                    break
+    more = any(kind != 'more' for kind in blocks[length:])
+    return length, more
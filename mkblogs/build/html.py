@@ -1,42 +1,321 @@
 import os, operator
 from mkblogs import utils, toc
 from mkblogs.build import nav
+from mkblogs.build.excerpt import block_kind, excerpt_cut, EXCERPT_PARAGRAPHS
+from mkblogs.build.meta import split_meta
+from mkblogs.compat import text_type
+from mkblogs.exceptions import ConfigurationError
 from mkblogs.mdextern import RelativePathExtension
+from mkblogs.mdextern.highlight_ext import HighlightCacheExtension
+from mkblogs.mdextern.relative_path_ext import prefix_url
 import markdown
+from markdown.treeprocessors import Treeprocessor
+from markdown.util import etree
 import logging
+import threading
 
 """
 compiling functions
 """
+log = logging.getLogger('mkblogs')
+
+#every worker thread (or process) keeps its own configured markdown instances
+_engines = threading.local()
+
+
+def get_markdown(extensions=()):
+    """
+    Return the markdown.Markdown instance of the current thread for the given
+    user `extensions`, it is configured once and reused for every document.
+    The RelativePathExtension of the instance is reachable as `md.relpath` so
+    the page it works on can be rebound before each conversion.
+    """
+    extensions = tuple(extensions)
+    pool = getattr(_engines, 'pool', None)
+    if pool is None:
+        pool = _engines.pool = {}
+    md = pool.get(extensions)
+    if md is None:
+        builtin_extensions = ['meta', 'toc', 'tables', 'fenced_code']
+        relpath = RelativePathExtension(None, False)
+        md = markdown.Markdown(
+            extensions=builtin_extensions + [relpath] + list(extensions) +
+                [HighlightCacheExtension()]
+        )
+        md.relpath = relpath
+        # last of all, after the treeprocessors of the user extensions
+        md.treeprocessors.add('keep_tree', KeepTreeprocessor(md), '_end')
+        pool[extensions] = md
+    return md
+
+
+class KeepTreeprocessor(Treeprocessor):
+    """
+    keeps the final tree of the document as `md.last_root`, so its excerpt
+    can be cut from it and rendered again by render_excerpt
+    """
+    def run(self, root):
+        self.markdown.last_root = root
+        return root
+
+
+class MarkdownBackend(object):
+    """
+    Python-Markdown, the default backend.
+
+    A backend converts a markdown source to a fragment, the dict of its
+    'html', 'meta', 'linked', 'refs', 'anchors', 'headings', 'excerpt' and
+    'more' (whether the document goes on after its excerpt), it is chosen
+    with 'markdown_backend' in the config.
+    """
+    name = 'markdown'
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def cache_key(self):
+        """
+        what the fragments cached depend on, besides the markdown version
+        """
+        return self.name
+
+    def convert(self, markdown_source, page=None, extensions=(),
+            strict=False, prefix=None, links=None, highlights=None,
+            excerpt_paragraphs=EXCERPT_PARAGRAPHS):
+        # Generate the HTML from the markdown source
+        md = get_markdown(extensions)
+        md.relpath.set_page(page, strict, prefix, links)
+        md.highlight_cache = highlights
+        md.excerpt_paragraphs = excerpt_paragraphs
+        md.reset()
+        # On completely blank markdown files, no Meta property is added to
+        # the generated document, so don't leak the one of the last document.
+        md.Meta = {}
+        md.last_root = None
+        html_content = md.convert(markdown_source)
+        _engines.last = md
+        excerpt, more = _excerpt_tree(md)
+        return {
+            'html': html_content,
+            'meta': md.Meta,
+            'linked': list(md.relpath.linked),
+            'refs': list(md.relpath.refs),
+            'anchors': list(md.relpath.anchors),
+            'headings': list(md.relpath.headings),
+            'excerpt': _render_tree(md, excerpt),
+            'more': more,
+        }
+
+
+class MistuneBackend(MarkdownBackend):
+    """
+    mistune, much faster than Python-Markdown, used if it is installed. The
+    meta, the toc ids, tables and fenced code are done as the extensions
+    mkblogs loads do them, other markdown extensions can't be used with it.
+    """
+    name = 'mistune'
+
+    @classmethod
+    def available(cls):
+        try:
+            import mistune
+        except ImportError:
+            return False
+        #the renderer is written for the api of mistune 0.8
+        return mistune.__version__.startswith('0.')
+
+    def cache_key(self):
+        import mistune
+        return '%s-%s' % (self.name, mistune.__version__)
+
+    def convert(self, markdown_source, page=None, extensions=(),
+            strict=False, prefix=None, links=None, highlights=None,
+            excerpt_paragraphs=EXCERPT_PARAGRAPHS):
+        md = getattr(_engines, 'mistune', None)
+        if md is None:
+            from mkblogs.mdextern.mistune_renderer import make_markdown
+            md = _engines.mistune = make_markdown()
+        md.renderer.set_page(page, strict, prefix, links)
+        meta, body = split_meta(text_type(markdown_source))
+        try:
+            html_content = md(body).strip()
+        except:
+            # the half parsed document stays in the instance
+            _engines.mistune = None
+            raise
+        # only Python-Markdown can render a document again
+        _engines.last = None
+        renderer = md.renderer
+        length, more = excerpt_cut([kind for kind, html in md.blocks],
+                excerpt_paragraphs)
+        return {
+            'html': html_content,
+            'meta': meta,
+            'linked': list(renderer.linked),
+            'refs': list(renderer.refs),
+            'anchors': list(renderer.anchors),
+            'headings': list(renderer.headings),
+            'excerpt': ''.join(html for kind, html in md.blocks[:length]
+                ).strip(),
+            'more': more,
+        }
+
+
+BACKENDS = {
+    'markdown': MarkdownBackend,
+    'mistune': MistuneBackend,
+}
+
+_backends = {}
+
+
+def get_backend(name=None, extensions=()):
+    """
+    the backend @name, Python-Markdown if it is None, or if the backend isn't
+    installed or can't use the markdown @extensions
+    """
+    name = name or MarkdownBackend.name
+    backend = _backends.get((name, bool(extensions)))
+    if backend is not None:
+        return backend
+    if name not in BACKENDS:
+        raise ConfigurationError("Unknown markdown_backend '%s', use one of "
+                "%s" % (name, ', '.join(sorted(BACKENDS))))
+    cls = BACKENDS[name]
+    if not cls.available():
+        log.warning("The markdown backend '%s' is not installed, using "
+                "Python-Markdown", name)
+        cls = MarkdownBackend
+    elif extensions and cls is not MarkdownBackend:
+        log.warning("The markdown backend '%s' can't use markdown_extensions, "
+                "using Python-Markdown", name)
+        cls = MarkdownBackend
+    backend = _backends[(name, bool(extensions))] = cls()
+    return backend
+
+
 def convert_markdown(markdown_source, page=None, extensions=(),
-        strict=False, prefix=None):
+        strict=False, prefix=None, linked=None, cache=None, links=None,
+        refs=None, anchors=None, backend=None,
+        excerpt_paragraphs=EXCERPT_PARAGRAPHS, excerpts=None):
     """
     Convert the Markdown source file to HTML content, and additionally
     return the parsed table of contents, and a dictionary of any metadata
     that was specified in the Markdown file.
 
     `extensions` is an optional sequence of Python Markdown extensions to add
-    to the default set.
+    to the default set. If `linked` is a list, the markdown files the source
+    links to are appended to it, `refs` gets the (markdown file, anchor) of
+    its internal links and `anchors` the ids of its elements, for checking
+    the links once the site is built. `cache` is an optional FragmentCache
+    the conversion is looked up in and stored to, its code blocks are
+    highlighted through its HighlightCache, `links` is the LinkIndex of
+    the build. `backend` is the name of the markdown backend, see
+    get_backend. If `excerpts` is a list, the (html, more) of the excerpt of
+    the source is appended to it, see mkblogs.build.excerpt.
+    """
+    backend = get_backend(backend, extensions)
+    key = fragment = None
+    if cache is not None:
+        key = cache.key(markdown_source, extensions, page, strict, prefix,
+                backend.cache_key(), excerpt_paragraphs)
+        fragment = cache.get(key)
+        if fragment is not None and 'excerpt' not in fragment:
+            # stored before excerpts were cut
+            fragment = None
+    if fragment is not None:
+        _engines.last = None
+    else:
+        fragment = backend.convert(markdown_source, page, extensions, strict,
+                prefix, links, cache.highlights if cache is not None else None,
+                excerpt_paragraphs)
+        if cache is not None:
+            cache.put(key, fragment)
+
+    if linked is not None:
+        linked.extend(fragment['linked'])
+    if refs is not None:
+        refs.extend(tuple(ref) for ref in fragment['refs'])
+    if anchors is not None:
+        anchors.extend(fragment['anchors'])
+    if excerpts is not None:
+        excerpts.append((fragment['excerpt'], fragment['more']))
+
+    # the table of contents is made of the headings if a template uses it
+    table_of_contents = toc.TableOfContents(
+            [tuple(heading) for heading in fragment['headings']])
+
+    return (fragment['html'], table_of_contents, fragment['meta'])
+
+
+def render_excerpt(prefix):
+    """
+    Render the excerpt of the last document converted by this thread again,
+    with @prefix put before its relative urls, as converting it with `prefix`
+    would. The tree of the document is reused, so it can be done only once.
+    Return its (html, more), or None if the document wasn't parsed (it came
+    from the cache).
+    """
+    md = _prefix_last(prefix)
+    if md is None:
+        return None
+    excerpt, more = _excerpt_tree(md)
+    return _render_tree(md, excerpt), more
+
+
+def _prefix_last(prefix):
+    """
+    the markdown instance of the last document converted by this thread if
+    its tree is there, with @prefix put before its relative urls
     """
+    md = getattr(_engines, 'last', None)
+    _engines.last = None
+    if md is None or md.last_root is None:
+        return None
+    for element, key in md.relpath.rewritten:
+        element.set(key, prefix_url(element.get(key), prefix))
+    return md
 
-    # Generate the HTML from the markdown source
-    builtin_extensions = ['meta', 'toc', 'tables', 'fenced_code']
-    mkblogs_extensions = [RelativePathExtension(page, strict, prefix), ]
-    extensions = builtin_extensions + mkblogs_extensions + list(extensions)
-    md = markdown.Markdown(
-        extensions=extensions
-    )
-    html_content = md.convert(markdown_source)
 
-    # On completely blank markdown files, no Meta or toc properties are added
-    # to the generated document.
-    meta = getattr(md, 'Meta', {})
-    toc_html = getattr(md, 'toc', '')
+def _excerpt_tree(md):
+    """
+    Return (root, more), a root holding the top level elements of the last
+    document of @md in its excerpt and whether the document goes on after
+    them
+    """
+    root = md.last_root
+    if root is None:
+        return None, False
+    children = list(root)
+    length, more = excerpt_cut([block_kind(md, child) for child in children],
+            getattr(md, 'excerpt_paragraphs', EXCERPT_PARAGRAPHS))
+    excerpt = etree.Element(md.doc_tag)
+    for child in children[:length]:
+        excerpt.append(child)
+    return excerpt, more
 
-    # Post process the generated table of contents into a data structure
-    table_of_contents = toc.TableOfContents(toc_html)
 
-    return (html_content, table_of_contents, meta)
+def _render_tree(md, root):
+    """
+    the html of the tree @root of a document converted by @md, '' if it is
+    empty
+    """
+    if root is None:
+        return ''
+    # the tail of markdown.Markdown.convert
+    output = md.serializer(root)
+    if md.stripTopLevelTags:
+        try:
+            start = output.index('<%s>' % md.doc_tag) + len(md.doc_tag) + 2
+            end = output.rindex('</%s>' % md.doc_tag)
+        except ValueError:
+            # an empty document
+            return ''
+        output = output[start:end].strip()
+    for pp in md.postprocessors.values():
+        output = pp.run(output)
+    return output.strip()
 
 
 def get_located_path(file_path):
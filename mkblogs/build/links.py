@@ -0,0 +1,120 @@
+# coding: utf-8
+
+"""
+Checking the links of the site once it is built.
+
+Converting a page collects its internal links, (markdown file, anchor), and
+the ids of its elements, which the anchors point at. The manifest keeps them
+for every blog, the static pages are built every time, so after the build the
+links of the whole site are checked in one pass over them, the files linked
+looked up in the LinkIndex of the build rather than on the disk.
+
+The broken links are printed and written to the JSON report 'link_report',
+in strict mode they fail the build.
+"""
+
+from __future__ import print_function
+
+import json
+import logging
+import threading
+
+from mkblogs import utils
+from mkblogs.exceptions import MarkdownNotFound
+
+log = logging.getLogger('mkblogs')
+
+
+class LinkGraph(object):
+    """
+    source -> (refs, anchors) of the pages converted, can be shared by threads
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sources = {}
+
+    def add(self, source, refs, anchors):
+        with self.lock:
+            self.sources[source] = (list(refs), list(anchors))
+
+    def update(self, sources):
+        """
+        add the (refs, anchors) of the dict @sources, the sources already in
+        the graph are kept
+        """
+        with self.lock:
+            for source, links in sources.items():
+                self.sources.setdefault(source, links)
+
+    def broken(self, files):
+        """
+        the broken links, dicts of their 'source', 'target', 'anchor' and
+        'reason'. @files are the markdown files of the site, besides the
+        sources of the graph.
+        """
+        anchors = {}
+        broken = []
+        with self.lock:
+            sources = dict(self.sources)
+        for source in sorted(sources):
+            for target, anchor in sources[source][0]:
+                if target not in sources:
+                    if target in files:
+                        # not converted, its anchors are unknown
+                        continue
+                    reason = 'missing page'
+                elif anchor is None:
+                    continue
+                else:
+                    if target not in anchors:
+                        anchors[target] = set(sources[target][1])
+                    if anchor in anchors[target]:
+                        continue
+                    reason = 'missing anchor'
+                broken.append({
+                    'source': source,
+                    'target': target,
+                    'anchor': anchor,
+                    'reason': reason,
+                })
+        return broken
+
+
+def link_message(link):
+    if link['reason'] == 'missing page':
+        return ('The page "%s" contained a hyperlink to "%s" which does not '
+                'exist.') % (link['source'], link['target'])
+    return ('The page "%s" contained a hyperlink to "%s#%s" whose anchor does '
+            'not exist.') % (link['source'], link['target'], link['anchor'])
+
+
+def check_links(config, manifest=None):
+    """
+    check the links of the pages in config['link_graph'] and of the blogs in
+    the @manifest, write the report, raise MarkdownNotFound in strict mode if
+    there are broken links
+    """
+    graph = config.get('link_graph') or LinkGraph()
+    if manifest:
+        graph.update(manifest.link_graph())
+    index = config.get('link_index')
+    files = index.files if index and index.files is not None else ()
+
+    broken = graph.broken(files)
+    nlinks = sum(len(refs) for refs, anchors in graph.sources.values())
+    log.debug("Checked %d links of %d pages", nlinks, len(graph.sources))
+    if config.get('link_report'):
+        report = {
+            'pages': len(graph.sources),
+            'links': nlinks,
+            'broken': broken,
+        }
+        text = json.dumps(report, indent=2, sort_keys=True,
+                separators=(',', ': '))
+        utils.write_file(text.encode('utf-8'), config['link_report'])
+
+    for link in broken:
+        print(link_message(link))
+    if broken and config.get('strict'):
+        raise MarkdownNotFound('%d broken links, the first: %s' % (
+            len(broken), link_message(broken[0])))
@@ -0,0 +1,307 @@
+# coding: utf-8
+
+"""
+The build manifest remembers what every blog was built from.
+
+For every source file under the docs dir it keeps the content hash, size and
+mtime it had when its output was written, and the output path. Checking a
+source only needs a stat when nothing changed; the content is hashed only
+when size or mtime don't match, so a checkout or a cache restore touching the
+mtimes doesn't rebuild anything. The whole manifest is dropped when the
+toolchain (mkblogs, markdown, jinja2, python) changes.
+
+Along with the source, every output records what else it was built from: the
+templates loaded to render it, a fingerprint of the config it read and the
+markdown files it links to. A change to any of them rebuilds the output.
+"""
+
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import sys
+import threading
+
+import jinja2
+import markdown
+
+import mkblogs
+from mkblogs import utils
+
+# 2: the entries keep the links and anchors of the sources
+MANIFEST_VERSION = 2
+
+
+def toolchain_fingerprint():
+    return ' '.join([
+        'mkblogs-%s' % mkblogs.__version__,
+        'markdown-%s' % markdown.version,
+        'jinja2-%s' % jinja2.__version__,
+        'python-%d.%d' % sys.version_info[:2],
+    ])
+
+
+def config_fingerprint(config, keys):
+    """
+    digest of the values of @keys in @config
+    """
+    values = [(key, config.get(key)) for key in sorted(keys)]
+    text = json.dumps(values, sort_keys=True, default=repr)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class TrackingEnvironment(jinja2.Environment):
+    """
+    A jinja2 Environment remembering the files of the templates loaded by the
+    current thread inside record_templates(). Includes and extends are loaded
+    while rendering, so they are recorded too.
+    """
+    def __init__(self, *args, **kwargs):
+        super(TrackingEnvironment, self).__init__(*args, **kwargs)
+        self._recording = threading.local()
+
+    def get_template(self, name, parent=None, globals=None):
+        template = super(TrackingEnvironment, self).get_template(
+                name, parent, globals)
+        loaded = getattr(self._recording, 'loaded', None)
+        if loaded is not None and template.filename:
+            loaded.add(template.filename)
+        return template
+
+    @contextmanager
+    def record_templates(self):
+        loaded = self._recording.loaded = set()
+        try:
+            yield loaded
+        finally:
+            self._recording.loaded = None
+
+
+class BuildManifest(object):
+    """
+    source path -> {'hash', 'size', 'mtime', 'output', 'config', 'templates',
+    'templates_digest', 'links'}, paths are relative to @base_dir.
+    @config_digest is the config_fingerprint of the config keys the outputs
+    are built from.
+    """
+    def __init__(self, filename, base_dir, toolchain=None, config_digest=None):
+        self.filename = filename
+        self.base_dir = base_dir
+        self.toolchain = toolchain or toolchain_fingerprint()
+        self.config_digest = config_digest
+        self.lock = threading.Lock()
+        #hashes computed by is_fresh, so record doesn't read the file again
+        self.pending = {}
+        #the dependencies are shared by many outputs, check them once a build
+        self.template_digests = {}
+        self.existing = {}
+
+        data = utils.load_json(filename)
+        if data.get('version') == MANIFEST_VERSION and \
+                data.get('toolchain') == self.toolchain:
+            self.files = data.get('files', {})
+            self.generated = data.get('generated', {})
+            self.dirs = data.get('dirs', {})
+        else:
+            self.files = {}
+            self.generated = {}
+            self.dirs = {}
+        #only the directories seen by this build are saved
+        self.seen_dirs = {}
+
+    def is_fresh(self, path, st=None):
+        """
+        Return True if the output of @path was built from its current content
+        and still exists. @st is the stat result of @path if known already.
+        """
+        abs_path = os.path.join(self.base_dir, path)
+        if st is None:
+            st = os.stat(abs_path)
+        entry = self.files.get(path)
+        if not entry or \
+                not os.path.exists(os.path.join(self.base_dir, entry['output'])):
+            return False
+        if entry['size'] != st.st_size:
+            return False
+        if entry['mtime'] != st.st_mtime:
+            digest = utils.file_digest(abs_path)
+            with self.lock:
+                self.pending[path] = (digest, st)
+            if digest != entry['hash']:
+                return False
+            # same content, only remember the new mtime
+            with self.lock:
+                entry['mtime'] = st.st_mtime
+        return self.deps_fresh(entry)
+
+    def built_fresh(self, path):
+        """
+        Like is_fresh, for a source known to be unchanged: only its output
+        and dependencies are checked
+        """
+        entry = self.files.get(path)
+        if not entry or \
+                not os.path.exists(os.path.join(self.base_dir, entry['output'])):
+            return False
+        return self.deps_fresh(entry)
+
+    def deps_fresh(self, entry):
+        """
+        Return True if nothing @entry was built from besides its source changed
+        """
+        if entry.get('config') != self.config_digest:
+            return False
+        templates = entry.get('templates', [])
+        if self.templates_digest(templates) != entry.get('templates_digest'):
+            return False
+        for target, existed in entry.get('links', {}).items():
+            if self.exists(target) != existed:
+                return False
+        return True
+
+    def template_digest(self, filename):
+        digest = self.template_digests.get(filename)
+        if digest is None:
+            try:
+                digest = utils.file_digest(filename)
+            except (IOError, OSError):
+                digest = ''
+            self.template_digests[filename] = digest
+        return digest
+
+    def templates_digest(self, templates):
+        sha1 = hashlib.sha1()
+        for filename in sorted(templates):
+            sha1.update(('%s %s\n' % (filename,
+                self.template_digest(filename))).encode('utf-8'))
+        return sha1.hexdigest()
+
+    def exists(self, path):
+        """
+        whether the file @path, relative to the base dir, exists, checked once
+        a build
+        """
+        existed = self.existing.get(path)
+        if existed is None:
+            existed = self.existing[path] = os.path.exists(
+                    os.path.join(self.base_dir, path))
+        return existed
+
+    def output_digest(self, path):
+        """
+        the content digest of the output of @path when it was last built
+        """
+        entry = self.files.get(path)
+        return entry.get('output_hash') if entry else None
+
+    def record(self, path, output, deps=None, output_digest=None):
+        """
+        the output of @path has been written to @output, @deps is a dict with
+        the 'templates' it loaded and the markdown files it 'links' to, and
+        the 'refs' and 'anchors' its links are checked with
+        """
+        deps = deps or {}
+        with self.lock:
+            digest, st = self.pending.pop(path, (None, None))
+        if digest is None:
+            abs_path = os.path.join(self.base_dir, path)
+            st = os.stat(abs_path)
+            digest = utils.file_digest(abs_path)
+        templates = sorted(deps.get('templates', []))
+        links = dict((target, self.exists(target))
+                for target in deps.get('links', []))
+        with self.lock:
+            self.files[path] = {
+                'hash': digest,
+                'size': st.st_size,
+                'mtime': st.st_mtime,
+                'output': output,
+                'output_hash': output_digest,
+                'config': self.config_digest,
+                'templates': templates,
+                'templates_digest': self.templates_digest(templates),
+                'links': links,
+                'refs': [list(ref) for ref in deps.get('refs', [])],
+                'anchors': list(deps.get('anchors', [])),
+            }
+
+    def link_graph(self):
+        """
+        path -> (refs, anchors) of every source built, see record
+        """
+        graph = {}
+        with self.lock:
+            for path, entry in self.files.items():
+                graph[path] = ([tuple(ref) for ref in entry.get('refs', [])],
+                        entry.get('anchors', []))
+        return graph
+
+    def forget(self, path):
+        with self.lock:
+            self.files.pop(path, None)
+
+    def generated_fresh(self, output, config_digest, content=None):
+        """
+        Return True if the generated page @output exists and its templates
+        and config didn't change. Whether the data it is generated from
+        changed is up to the caller, or told by the digest @content of the
+        data given to record_generated.
+        """
+        entry = self.generated.get(output)
+        if not entry or not os.path.exists(output):
+            return False
+        if entry.get('config') != config_digest:
+            return False
+        if entry.get('content') != content:
+            return False
+        templates = entry.get('templates', [])
+        return self.templates_digest(templates) == entry.get('templates_digest')
+
+    def record_generated(self, output, config_digest, templates, content=None):
+        templates = sorted(templates)
+        with self.lock:
+            self.generated[output] = {
+                'config': config_digest,
+                'templates': templates,
+                'templates_digest': self.templates_digest(templates),
+                'content': content,
+            }
+
+    def generated_outputs(self):
+        with self.lock:
+            return list(self.generated)
+
+    def forget_generated(self, output):
+        with self.lock:
+            self.generated.pop(output, None)
+
+    def dir_listing(self, path, mtime, key):
+        """
+        the markdown 'files' and the 'dirs' of the directory @path when it was
+        last listed, if its mtime and the listing @key are the same
+        """
+        entry = self.dirs.get(path)
+        if not entry or entry['mtime'] != mtime or entry['key'] != key:
+            return None
+        with self.lock:
+            self.seen_dirs[path] = entry
+        return entry
+
+    def record_dir(self, path, mtime, key, dirs, files):
+        with self.lock:
+            self.seen_dirs[path] = {
+                'mtime': mtime,
+                'key': key,
+                'dirs': dirs,
+                'files': files,
+            }
+
+    def save(self):
+        with self.lock:
+            utils.write_json(self.filename, {
+                'version': MANIFEST_VERSION,
+                'toolchain': self.toolchain,
+                'files': self.files,
+                'generated': self.generated,
+                'dirs': self.seen_dirs,
+            })
@@ -0,0 +1,98 @@
+# coding: utf-8
+
+"""
+Reading the meta of a blog without converting it.
+
+The record only needs the title, date and tags of a blog, they are in the
+meta block at the top of the file. read_meta reads the file a block at a time
+until the meta block ends, usually the first block, and parses it the way the
+meta extension of markdown does. split_meta does the same for the markdown
+backends which have no meta extension.
+"""
+
+from markdown.extensions.meta import META_RE, META_MORE_RE
+
+from mkblogs import utils
+
+BLOCK_SIZE = 4096
+
+
+def parse_meta(lines):
+    """
+    Return (meta, done), the meta in the leading @lines, done is False if the
+    meta block may go on after them
+    """
+    meta, done, count = _parse_meta(lines)
+    return meta, done
+
+
+def _parse_meta(lines):
+    """
+    parse_meta, and the number of leading @lines the meta block takes, its
+    blank line included
+    """
+    meta = {}
+    key = None
+    count = 0
+    for line in lines:
+        if line.strip() == '':
+            return meta, True, count + 1
+        m1 = META_RE.match(line)
+        if m1:
+            key = m1.group('key').lower().strip()
+            value = m1.group('value').strip()
+            meta.setdefault(key, []).append(value)
+            count += 1
+            continue
+        m2 = META_MORE_RE.match(line)
+        if m2 and key:
+            meta[key].append(m2.group('value').strip())
+            count += 1
+            continue
+        return meta, True, count
+    return meta, False, count
+
+
+def split_meta(text):
+    """
+    Return (meta, body), the meta of the markdown @text and the text after
+    its meta block, as the meta extension of markdown splits them
+    """
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    meta, done, count = _parse_meta(lines)
+    return meta, '\n'.join(lines[count:])
+
+
+def read_meta(path, block_size=BLOCK_SIZE):
+    """
+    the meta of the markdown file @path, {} if it has none
+    """
+    data = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(block_size)
+            data += chunk
+            lines = data.split(b'\n')
+            if chunk:
+                # the last line may go on in the next block
+                lines.pop()
+            meta, done = parse_meta(line.decode('utf-8') for line in lines)
+            if done or not chunk:
+                return meta
+
+
+def meta_entry(meta):
+    """
+    Return (entry, sort_key), the record entry [title, date, tags] of a blog
+    with @meta and the utils.blog_sort_key of its date
+    """
+    try:
+        title = (meta.get('title') or meta.get('Title'))[0]
+        date = (meta.get('date') or meta.get('Date'))[0]
+    except (TypeError, IndexError):
+        raise NameError('Error in retrieving blogs meta')
+    sort_key = utils.blog_sort_key(date)
+    tags = meta.get('tags') or meta.get('Tags')
+    if not tags:
+        tags = ['NO TAGS']
+    return [title, utils.parse_date(date), tags], sort_key
@@ -0,0 +1,154 @@
+# coding: utf-8
+
+"""
+Themes compiled ahead of time.
+
+`mkblogs compile-theme` compiles the templates of the theme with jinja2's
+compile_templates into the zip 'compiled_theme'. The json file next to it,
+'compiled_theme'.json, records what they were compiled from: the versions of
+jinja2 and python and the digest of the source of every template.
+
+A build loads the templates from the zip when it is up to date, so a cold
+build, in a CI job, compiles no template. When a template changed, or jinja2
+or python did, the zip is stale and the templates are loaded from their
+sources, as without a compiled theme.
+"""
+
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import threading
+
+import jinja2
+
+from mkblogs import utils
+
+log = logging.getLogger('mkblogs')
+
+COMPILED_VERSION = 1
+
+
+def info_path(target):
+    """
+    the json file recording what the compiled theme @target is made of
+    """
+    return target + '.json'
+
+
+def template_sources(loader):
+    """
+    Return (digests, filenames), the sha1 of the source of every template
+    @loader finds, and the file it is read from, by template name
+    """
+    env = jinja2.Environment(loader=loader)
+    digests, filenames = {}, {}
+    for name in loader.list_templates():
+        if not utils.is_html_file(name):
+            continue
+        source, filename, uptodate = loader.get_source(env, name)
+        digests[name] = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        filenames[name] = filename
+    return digests, filenames
+
+
+def compiled_info(digests):
+    """
+    what a theme compiled from templates of @digests is made of
+    """
+    return {
+        'version': COMPILED_VERSION,
+        'jinja2': jinja2.__version__,
+        'python': sys.version_info[0],
+        'templates': digests,
+    }
+
+
+class PrecompiledLoader(jinja2.ModuleLoader):
+    """
+    A ModuleLoader of the compiled theme @path. Its templates keep the name of
+    their source file, the manifest records it as what the outputs depend
+    on. The templates not compiled are loaded by @sources.
+
+    A template module is imported once: ModuleLoader imports it again on
+    every load, and python 2 empties the globals of the module replaced,
+    which the templates loaded before still run in.
+    """
+    def __init__(self, path, sources, filenames, info):
+        jinja2.ModuleLoader.__init__(self, path)
+        self.path = path
+        self.sources = sources
+        self.filenames = filenames
+        self.info = info
+        self.modules = {}
+        self.lock = threading.Lock()
+
+    def load(self, environment, name, globals=None):
+        if name not in self.filenames:
+            return self.sources.load(environment, name, globals)
+        with self.lock:
+            module = self.modules.get(name)
+            if module is None:
+                jinja2.ModuleLoader.load(self, environment, name, globals)
+                module = getattr(self.module, self.get_template_key(name))
+                self.modules[name] = module
+        template = environment.template_class.from_module_dict(environment,
+                module.__dict__, globals)
+        template.filename = self.filenames[name]
+        return template
+
+
+def theme_loader(config, current=None):
+    """
+    The loader of the templates of @config, a PrecompiledLoader of
+    'compiled_theme' if it is up to date, else a FileSystemLoader. The
+    loader @current is kept if it loads the same compiled theme.
+    """
+    sources = jinja2.FileSystemLoader(config['templates_dir'])
+    target = config.get('compiled_theme')
+    if not target or not os.path.isfile(target):
+        return sources
+    digests, filenames = template_sources(sources)
+    info = compiled_info(digests)
+    if utils.load_json(info_path(target)) != info:
+        log.info("The compiled theme %s is stale, loading the templates from "
+                "their sources", target)
+        return sources
+    path = os.path.abspath(target)
+    if isinstance(current, PrecompiledLoader) and current.path == path and \
+            current.info == info:
+        current.sources = sources
+        current.filenames = filenames
+        return current
+    log.debug("Loading the templates from %s", target)
+    return PrecompiledLoader(path, sources, filenames, info)
+
+
+def compile_templates(env, target):
+    """
+    compile the templates of the FileSystemLoader of @env into the zip
+    @target and record what they are compiled from, return the number of
+    templates compiled
+    """
+    digests, filenames = template_sources(env.loader)
+    directory = os.path.dirname(os.path.abspath(target))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    # a build never sees a zip half written, nor one out of step with its
+    # json: the json is removed first, the zip is renamed in place
+    if os.path.exists(info_path(target)):
+        os.remove(info_path(target))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp', suffix='.zip')
+    os.close(fd)
+    try:
+        env.compile_templates(tmp, filter_func=utils.is_html_file,
+                log_function=log.debug, ignore_errors=False)
+        # mkstemp makes it private
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    utils.write_json(info_path(target), compiled_info(digests))
+    return len(digests)
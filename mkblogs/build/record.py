@@ -0,0 +1,332 @@
+# coding: utf-8
+
+"""
+The blog record: the title, date and tags of every blog, in an sqlite
+database next to the blogs.
+
+The catalog and the index are generated from the record, queried from the
+database rather than loaded as a whole: the blogs on the index are the first
+rows of the date index, a catalog is a scan of the tag index. The updates of
+a build are made in one transaction, so an interrupted build leaves the
+record as it was before.
+
+The record keeps the excerpt of every blog as well, the html the index
+shows of it, see mkblogs.build.excerpt.
+
+The record used to be the '.record' JSON file, it is moved to the database
+the first time the database is opened.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+
+from mkblogs import utils
+
+log = logging.getLogger('mkblogs')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    path TEXT PRIMARY KEY,
+    title TEXT,
+    date TEXT,
+    sort_key REAL,
+    excerpt TEXT,
+    more INTEGER
+);
+CREATE INDEX IF NOT EXISTS posts_sort_key ON posts (sort_key DESC, path);
+CREATE TABLE IF NOT EXISTS tags (
+    tag TEXT,
+    path TEXT,
+    position INTEGER,
+    PRIMARY KEY (tag, path)
+);
+CREATE INDEX IF NOT EXISTS tags_path ON tags (path);
+"""
+
+
+class RecordStore(object):
+    """
+    blog path -> [title, date, tags], the entries are the ones the .record
+    file held. The store can be shared by threads.
+    """
+    def __init__(self, filename, json_record=None):
+        """
+        @json_record is the path of a .record file to migrate from
+        """
+        self.filename = filename
+        self.lock = threading.Lock()
+        exists = os.path.exists(filename)
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        columns = [row[1] for row in
+                self.db.execute('PRAGMA table_info(posts)')]
+        if 'excerpt' not in columns:
+            # a record from before excerpts, they are made when needed
+            self.db.execute('ALTER TABLE posts ADD COLUMN excerpt TEXT')
+            self.db.execute('ALTER TABLE posts ADD COLUMN more INTEGER')
+        if not exists and json_record and os.path.isfile(json_record):
+            self.migrate(json_record)
+
+    def migrate(self, json_record):
+        record = utils.load_json(json_record)
+        log.info("Moving %d blogs from %s to %s", len(record), json_record,
+                self.filename)
+        for path, entry in record.items():
+            self.put(path, entry)
+        self.commit()
+        os.rename(json_record, json_record + '.old')
+
+    def _entries(self, rows):
+        """
+        the entries of the posts in @rows of (path, title, date)
+        """
+        entries = {}
+        for path, title, date in rows:
+            entries[path] = [title, date, []]
+        paths = list(entries)
+        # in chunks, sqlite has a limit on the number of parameters
+        for i in range(0, len(paths), 500):
+            chunk = paths[i:i + 500]
+            cursor = self.db.execute(
+                'SELECT path, tag FROM tags WHERE path IN (%s) '
+                'ORDER BY path, position' % ','.join('?' * len(chunk)), chunk)
+            for path, tag in cursor:
+                entries[path][2].append(tag)
+        return entries
+
+    def get(self, path):
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT path, title, date FROM posts WHERE path = ?',
+                (path,)).fetchall()
+            return self._entries(rows).get(path)
+
+    def entries(self, paths):
+        """
+        path -> entry for the blogs of @paths in the record
+        """
+        paths = list(paths)
+        entries = {}
+        with self.lock:
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                rows = self.db.execute(
+                    'SELECT path, title, date FROM posts WHERE path IN (%s)'
+                    % ','.join('?' * len(chunk)), chunk).fetchall()
+                entries.update(self._entries(rows))
+        return entries
+
+    def load(self):
+        """
+        the whole record as a dict
+        """
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT path, title, date FROM posts').fetchall()
+            return self._entries(rows)
+
+    def paths(self):
+        with self.lock:
+            return set(path for (path,) in
+                    self.db.execute('SELECT path FROM posts'))
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+
+    def put(self, path, entry, sort_key=None, excerpt=None):
+        """
+        set the entry of @path, return the entry it replaces or None.
+        @sort_key is the utils.blog_sort_key of the date in the meta of the
+        blog, the date of the entry is used if it isn't given. @excerpt is the
+        (html, more) of the excerpt of the blog, None if it isn't known, the
+        excerpt stored is kept then.
+        """
+        html, more = excerpt or (None, None)
+        title, date, tags = entry
+        if sort_key is None:
+            sort_key = utils.blog_sort_key(date)
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT path, title, date FROM posts WHERE path = ?',
+                (path,)).fetchall()
+            old = self._entries(rows).get(path)
+            if old is None:
+                self.db.execute(
+                    'INSERT INTO posts '
+                    '(path, title, date, sort_key, excerpt, more) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (path, title, date, sort_key, html, more))
+            elif excerpt is None:
+                self.db.execute(
+                    'UPDATE posts SET title = ?, date = ?, sort_key = ? '
+                    'WHERE path = ?', (title, date, sort_key, path))
+            else:
+                self.db.execute(
+                    'UPDATE posts SET title = ?, date = ?, sort_key = ?, '
+                    'excerpt = ?, more = ? WHERE path = ?',
+                    (title, date, sort_key, html, more, path))
+            if old is None or old[2] != list(tags):
+                # the tag index changes only for the blogs retagged
+                self.db.execute('DELETE FROM tags WHERE path = ?', (path,))
+                self.db.executemany(
+                    'INSERT OR IGNORE INTO tags (tag, path, position) '
+                    'VALUES (?, ?, ?)',
+                    [(tag, path, i) for i, tag in enumerate(tags)])
+        return old
+
+    def excerpts(self, paths):
+        """
+        path -> (html, more) of the excerpts of the blogs of @paths, the
+        blogs without one are left out
+        """
+        paths = list(paths)
+        excerpts = {}
+        with self.lock:
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                for path, html, more in self.db.execute(
+                        'SELECT path, excerpt, more FROM posts WHERE path IN '
+                        '(%s) AND excerpt IS NOT NULL'
+                        % ','.join('?' * len(chunk)), chunk):
+                    excerpts[path] = (html, bool(more))
+        return excerpts
+
+    def set_excerpt(self, path, excerpt):
+        """
+        set the (html, more) @excerpt of the blog @path
+        """
+        html, more = excerpt
+        with self.lock:
+            self.db.execute(
+                'UPDATE posts SET excerpt = ?, more = ? WHERE path = ?',
+                (html, more, path))
+
+    def remove(self, path):
+        """
+        remove the entry of @path, return it
+        """
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT path, title, date FROM posts WHERE path = ?',
+                (path,)).fetchall()
+            old = self._entries(rows).get(path)
+            self.db.execute('DELETE FROM posts WHERE path = ?', (path,))
+            self.db.execute('DELETE FROM tags WHERE path = ?', (path,))
+        return old
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+
+    def rollback(self):
+        with self.lock:
+            self.db.rollback()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def sort_key(self, path):
+        with self.lock:
+            row = self.db.execute('SELECT sort_key FROM posts WHERE path = ?',
+                    (path,)).fetchone()
+        return row[0] if row else None
+
+    def top(self, n):
+        """
+        the paths of the @n newest blogs, in the order of utils.sort_blogs
+        """
+        with self.lock:
+            return [path for (path,) in self.db.execute(
+                'SELECT path FROM posts ORDER BY sort_key DESC, path LIMIT ?',
+                (n,))]
+
+    def newest_before(self, key):
+        """
+        the sort_key of the newest blog older than the sort_key @key, None if
+        there is none, a lookup in the date index
+        """
+        with self.lock:
+            return self.db.execute(
+                'SELECT MAX(sort_key) FROM posts WHERE sort_key < ?',
+                (key,)).fetchone()[0]
+
+    def oldest_from(self, key):
+        """
+        the sort_key of the oldest blog not older than the sort_key @key, None
+        if there is none
+        """
+        with self.lock:
+            return self.db.execute(
+                'SELECT MIN(sort_key) FROM posts WHERE sort_key >= ?',
+                (key,)).fetchone()[0]
+
+    def posts(self, chunk=500):
+        """
+        yield (path, title, date, sort_key) of every blog, newest first. The
+        rows are read @chunk at a time, the store isn't locked in between.
+        """
+        last = None
+        while True:
+            with self.lock:
+                if last is None:
+                    rows = self.db.execute(
+                        'SELECT path, title, date, sort_key FROM posts '
+                        'ORDER BY sort_key DESC, path LIMIT ?',
+                        (chunk,)).fetchall()
+                else:
+                    rows = self.db.execute(
+                        'SELECT path, title, date, sort_key FROM posts '
+                        'WHERE sort_key < ? OR (sort_key = ? AND path > ?) '
+                        'ORDER BY sort_key DESC, path LIMIT ?',
+                        (last[1], last[1], last[0], chunk)).fetchall()
+            for row in rows:
+                yield row
+            if len(rows) < chunk:
+                return
+            last = (rows[-1][0], rows[-1][3])
+
+    def tags(self):
+        """
+        tag -> number of blogs with the tag
+        """
+        with self.lock:
+            return dict(self.db.execute(
+                'SELECT tag, COUNT(*) FROM tags GROUP BY tag'))
+
+    def tag_posts(self, tag):
+        """
+        (path, title, date) of the blogs with @tag, newest first
+        """
+        with self.lock:
+            return self.db.execute(
+                'SELECT posts.path, posts.title, posts.date FROM tags '
+                'JOIN posts ON posts.path = tags.path WHERE tags.tag = ? '
+                'ORDER BY posts.sort_key DESC, posts.path', (tag,)).fetchall()
+
+    def catalog(self):
+        """
+        tag -> [(title, path)] of the blogs with the tag, newest first
+        """
+        catalist = {}
+        with self.lock:
+            cursor = self.db.execute(
+                'SELECT tags.tag, posts.title, posts.path FROM tags '
+                'JOIN posts ON posts.path = tags.path '
+                'ORDER BY tags.tag, posts.sort_key DESC, posts.path')
+            for tag, title, path in cursor:
+                catalist.setdefault(tag, []).append((title, path))
+        return catalist
+
+
+def open_record(config):
+    """
+    the RecordStore of the blogs in the docs dir, created from the .record
+    file if there is one
+    """
+    dot_record = config.get('dot_record') or '.record'
+    json_record = os.path.join(config['docs_dir'], dot_record)
+    return RecordStore(json_record + '.db', json_record)
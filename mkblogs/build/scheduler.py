@@ -0,0 +1,122 @@
+# coding: utf-8
+
+"""
+A small task graph, so the independent stages of a build can overlap.
+
+Every task is a callable with the names of the tasks it depends on, the graph
+runs a task on a pool of threads as soon as all of its dependencies are done.
+"""
+
+import logging
+import sys
+import threading
+
+from mkblogs.compat import reraise
+
+log = logging.getLogger('mkblogs')
+
+
+class Task(object):
+    def __init__(self, name, func, args=(), deps=()):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.deps = list(deps)
+        self.dependents = []
+        self.waiting = len(self.deps)
+
+    def run(self):
+        return self.func(*self.args)
+
+
+class TaskGraph(object):
+    """
+    Runs tasks in dependency order, independent tasks run concurrently. The
+    first task raising an exception stops the scheduling of new tasks and the
+    exception is raised again by run(), with its traceback, once the running
+    tasks are done.
+    """
+    def __init__(self):
+        self.tasks = {}
+        self.order = []
+
+    def add(self, name, func, args=(), deps=()):
+        if name in self.tasks:
+            raise ValueError("Task '%s' added twice" % name)
+        self.tasks[name] = Task(name, func, args, deps)
+        self.order.append(name)
+
+    def __len__(self):
+        return len(self.order)
+
+    def run(self, nworker=None):
+        for name in self.order:
+            task = self.tasks[name]
+            for dep in task.deps:
+                if dep not in self.tasks:
+                    raise ValueError("Task '%s' depends on unknown task '%s'"
+                            % (name, dep))
+                self.tasks[dep].dependents.append(task)
+
+        self.ready = [self.tasks[name] for name in self.order
+                if not self.tasks[name].waiting]
+        self.ready.reverse()
+        self.running = 0
+        self.finished = 0
+        self.error = None
+        self.cond = threading.Condition()
+
+        nworker = max(1, min(nworker or len(self), len(self)))
+        workers = [threading.Thread(target=self._work) for i in range(nworker)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        if self.error:
+            reraise(*self.error)
+        if self.finished != len(self):
+            raise ValueError("Task graph has a dependency cycle")
+
+    def _work(self):
+        while True:
+            with self.cond:
+                while not self.ready and not self._done():
+                    self.cond.wait()
+                if self._done():
+                    self.cond.notify_all()
+                    return
+                task = self.ready.pop()
+                self.running += 1
+
+            log.debug("Running build task '%s'", task.name)
+            try:
+                task.run()
+            except Exception:
+                # python 2 forgets the traceback of an exception raised again
+                # in another thread, it is kept with the exception
+                error = sys.exc_info()
+                log.exception("Build task '%s' failed", task.name)
+                with self.cond:
+                    self.running -= 1
+                    self.error = self.error or error
+                    self.cond.notify_all()
+                continue
+
+            with self.cond:
+                self.running -= 1
+                self.finished += 1
+                for dependent in task.dependents:
+                    dependent.waiting -= 1
+                    if not dependent.waiting:
+                        self.ready.append(dependent)
+                self.cond.notify_all()
+
+    def _done(self):
+        """
+        nothing more will be started: a task failed, or no task is ready and
+        none is running (all finished, or the rest wait on each other)
+        """
+        if self.error:
+            return True
+        return not self.ready and not self.running
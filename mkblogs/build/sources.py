@@ -0,0 +1,172 @@
+# coding: utf-8
+
+"""
+Finding the blogs under the docs dir.
+
+The docs dir is walked recursively, so blogs can live in year/month/ folders,
+with scandir: the stat of every entry comes along with the listing on most
+platforms and is handed to the manifest as is.
+
+The '.ignore' file at the top of the docs dir takes gitignore-style patterns,
+they are compiled once per build:
+
+    drafts/         a directory named drafts, anywhere
+    /notes.md       notes.md at the top only
+    2013/**/*.md    every markdown file below 2013/
+    !keep.md        but not keep.md, the last matching pattern wins
+
+Optionally the walk skips the directories whose mtime didn't change since the
+last build, taking their content from the manifest. A directory mtime only
+changes when an entry is added, removed or renamed in it, so a blog edited in
+place (rather than saved through a rename, as most editors do) in such a
+directory is not noticed. This is off unless 'prune_unchanged_dirs' is set.
+"""
+
+from collections import deque
+import hashlib
+import os
+import re
+
+from mkblogs import utils
+from mkblogs.compat import scandir
+
+DOT_IGNORE = '.ignore'
+
+
+def _translate(pattern):
+    """
+    regex source for the glob @pattern, '*' and '?' stop at '/', '**' doesn't
+    """
+    i, n = 0, len(pattern)
+    res = []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            res.append('(?:.*/)?')
+            i += 3
+            continue
+        elif pattern.startswith('**', i):
+            res.append('.*')
+            i += 2
+            continue
+        elif c == '*':
+            res.append('[^/]*')
+        elif c == '?':
+            res.append('[^/]')
+        elif c == '[' and pattern.find(']', i + 2) != -1:
+            j = pattern.find(']', i + 2)
+            chars = pattern[i + 1:j].replace('\\', '\\\\')
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+            res.append('[%s]' % chars)
+            i = j + 1
+            continue
+        elif c == '\\' and i + 1 < n:
+            res.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        else:
+            res.append(re.escape(c))
+        i += 1
+    return ''.join(res)
+
+
+class IgnoreRules(object):
+    """
+    gitignore-style patterns, match() takes paths relative to the top of the
+    tree with '/' as separator
+    """
+    def __init__(self, lines=()):
+        self.rules = []
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            line = line.rstrip(' ')
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            elif line.startswith('\\'):
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            if '/' in line:
+                # anchored to the top of the tree
+                regex = '^' + _translate(line.lstrip('/')) + '$'
+            else:
+                regex = '^(?:.*/)?' + _translate(line) + '$'
+            self.rules.append((re.compile(regex), negate, dir_only))
+        # the last matching pattern decides
+        self.rules.reverse()
+
+    def match(self, path, is_dir=False):
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(path):
+                return not negate
+        return False
+
+
+def read_ignore(ignored_file):
+    """
+    the lines of @ignored_file, none if it doesn't exist
+    """
+    if not os.path.isfile(ignored_file):
+        return []
+    with open(ignored_file) as f:
+        return f.readlines()
+
+
+def walk_sources(directory, pages=(), manifest=None, prune=False):
+    """
+    Yield (path, stat) for every markdown file under @directory which is not
+    a page nor ignored, the path is relative to @directory. The stat is None
+    for the files of the directories skipped by @prune.
+    """
+    lines = read_ignore(os.path.join(directory, DOT_IGNORE))
+    ignore = IgnoreRules(lines)
+    page_paths = set(utils.exact_page_config(page)[0] for page in pages)
+    # the directory listings kept in the manifest depend on what is filtered
+    # out of them
+    listing_key = hashlib.sha1(repr((lines, sorted(page_paths)))
+            .encode('utf-8')).hexdigest()
+
+    todo = deque([''])
+    while todo:
+        reldir = todo.popleft()
+        absdir = os.path.join(directory, reldir)
+        cached = None
+        if prune and manifest is not None:
+            try:
+                mtime = os.stat(absdir).st_mtime
+            except OSError:
+                continue
+            cached = manifest.dir_listing(reldir, mtime, listing_key)
+        if cached is not None:
+            for path in cached['files']:
+                yield path, None
+            todo.extend(cached['dirs'])
+            continue
+
+        files, dirs = [], []
+        for entry in scandir(absdir):
+            if entry.name.startswith('.'):
+                continue
+            path = os.path.join(reldir, entry.name)
+            key = path.replace(os.sep, '/')
+            if entry.is_dir():
+                if not ignore.match(key, True):
+                    dirs.append(path)
+                continue
+            if not utils.is_markdown_file(entry.name) or ignore.match(key):
+                continue
+            if os.path.join(directory, path) in page_paths:
+                continue
+            files.append(path)
+            yield path, entry.stat()
+        todo.extend(dirs)
+        if prune and manifest is not None:
+            manifest.record_dir(reldir, mtime, listing_key, dirs, files)
@@ -0,0 +1,122 @@
+# coding: utf-8
+
+"""
+One page per tag, listing its blogs newest first, split in pages of
+'tags_per_page' blogs: tags/<tag>.html, tags/<tag>-2.html, ...
+
+The blogs of a tag come from the tag index of the record. A build renders the
+pages of the tags its record delta touched, a tag added to or removed from a
+blog or a blog with the tag renamed, redated, added or removed. The pages of
+other tags are rendered only if their templates or config changed.
+"""
+
+import logging
+import math
+import os
+
+from mkblogs import utils
+from mkblogs.build import nav
+from mkblogs.build.build_pages import get_global_context, write_output, \
+        tag_page_path, PAGE_CONFIG_KEYS
+from mkblogs.build.manifest import config_fingerprint
+from mkblogs.build.record import open_record
+
+log = logging.getLogger('mkblogs')
+
+TAG_CONFIG_KEYS = PAGE_CONFIG_KEYS + ('tags_per_page',)
+
+
+def touched_tags(delta):
+    """
+    the tags whose pages list other blogs, or the same blogs differently,
+    after the changes of the record @delta
+    """
+    touched = set()
+    for old, new in delta.values():
+        if old and new and old[:2] == new[:2]:
+            # same title and date, only the tags changed
+            touched.update(set(old[2]) ^ set(new[2]))
+            continue
+        for entry in (old, new):
+            if entry:
+                touched.update(entry[2])
+    return touched
+
+
+def build_tag_pages(config, site_navigation, env, manifest=None):
+    """
+    render the pages of the tags touched by this build, see touched_tags,
+    and of the tags whose pages aren't up to date in the @manifest
+    """
+    per_page = int(config.get('tags_per_page') or 50)
+    tags_dir = config.get('tags_dir') or 'tags'
+    record = config.get('record_store') or open_record(config)
+    touched = config.get('touched_tags')
+    config_digest = config_fingerprint(config, TAG_CONFIG_KEYS)
+    template = env.get_template('base.html')
+
+    outputs = set()
+    for tag, count in record.tags().items():
+        npages = int(math.ceil(count / float(per_page)))
+        paths = [tag_page_path(tag, n, tags_dir) for n in range(1, npages + 1)]
+        outputs.update(paths)
+        if manifest and touched is not None and tag not in touched and \
+                all(manifest.generated_fresh(path, config_digest)
+                    for path in paths):
+            continue
+
+        log.debug("Building the pages of tag %s", tag)
+        blogs = record.tag_posts(tag)
+        for n, path in enumerate(paths, 1):
+            page = nav.Page(tag, '/' + path, path)
+            with env.record_templates() as templates:
+                context = get_global_context(page, site_navigation, config)
+                context.update(get_tag_context(page, tag, n, paths,
+                    blogs[(n - 1) * per_page:n * per_page], config))
+                output_content = template.render(context)
+            write_output(config, output_content.encode('utf-8'), path)
+            if manifest:
+                manifest.record_generated(path, config_digest, templates)
+
+    # the pages of the tags gone, or past the last page of a tag
+    if manifest:
+        for path in manifest.generated_outputs():
+            if path.startswith(tags_dir + '/') and path not in outputs:
+                log.debug("Removing the tag page %s", path)
+                if os.path.exists(path):
+                    os.remove(path)
+                manifest.forget_generated(path)
+
+
+def get_tag_context(page, tag, number, paths, blogs, config):
+    """
+    the context of the page @number of @tag, @paths are the paths of all its
+    pages and @blogs are the (path, title, date) of the blogs on the page
+    """
+    url_context = page.url_context
+    tag_blogs = []
+    for blog_path, title, date in blogs:
+        url = '/' + os.path.join(config['site_dir'],
+                utils.get_html_path(blog_path))
+        tag_blogs.append({
+            'title': title,
+            'date': date,
+            'url': url_context.make_relative(url),
+        })
+
+    def page_url(n):
+        if n < 1 or n > len(paths):
+            return None
+        return url_context.make_relative('/' + paths[n - 1])
+
+    return {
+        'structure': 'tag.html',
+        'page_title': tag,
+        'tag': tag,
+        'tag_blogs': tag_blogs,
+        'page_number': number,
+        'page_count': len(paths),
+        'previous_url': page_url(number - 1),
+        'next_url': page_url(number + 1),
+        'current_page': page,
+    }
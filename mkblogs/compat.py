@@ -23,6 +23,9 @@ if PY2:
     string_types = (str, unicode)
     unicode = unicode
     basestring = basestring
+
+    # the three argument raise is a syntax error in python 3
+    exec("def reraise(tp, value, tb):\n    raise tp, value, tb\n")
 else:  # PY3
     from urllib.parse import urljoin, urlparse, urlunparse, unquote
     urlunquote = unquote
@@ -40,3 +43,46 @@ else:  # PY3
     string_types = (str,)
     unicode = str
     basestring = (str, bytes)
+
+    def reraise(tp, value, tb):
+        raise value.with_traceback(tb)
+
+# os.scandir is new in python 3.5, the scandir package backports it
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+if scandir is None:
+    import os
+    import stat
+
+    class DirEntry(object):
+        """the part of os.DirEntry we need, over os.listdir and os.stat"""
+        def __init__(self, directory, name):
+            self.name = name
+            self.path = os.path.join(directory, name)
+            self._stat = None
+
+        def stat(self):
+            if self._stat is None:
+                self._stat = os.stat(self.path)
+            return self._stat
+
+        def is_dir(self):
+            try:
+                return stat.S_ISDIR(self.stat().st_mode)
+            except OSError:
+                return False
+
+        def is_file(self):
+            try:
+                return stat.S_ISREG(self.stat().st_mode)
+            except OSError:
+                return False
+
+    def scandir(directory):
+        return [DirEntry(directory, name) for name in os.listdir(directory)]
@@ -61,6 +61,10 @@ DEFAULT_CONFIG = {
     # PyMarkdown extension names.
     'markdown_extensions': (),
 
+    # What converts markdown, 'markdown' (Python-Markdown) or 'mistune', much
+    # faster if it is installed but without markdown_extensions.
+    'markdown_backend': 'markdown',
+
     # Determine if the site should generate a json search index and include
     # search elements in the theme. - TODO
     'include_search': False,
@@ -74,6 +78,53 @@ DEFAULT_CONFIG = {
     # encountered rather than display an error.
     'strict': False,
 
+    # The broken links found by a build are written to this JSON report.
+    'link_report': '.mkblogs-links.json',
+
+    # How blogs are compiled, 'thread' builds them with threads in this
+    # process, 'process' hands them in batches to a pool of processes so
+    # markdown and jinja rendering use every core. `--build-mode=process`
+    'build_mode': 'thread',
+
+    # Number of threads or processes compiling blogs, default: one per cpu.
+    'build_workers': None,
+
+    # How media files are put into the site: 'copy' copies all of them,
+    # 'incremental' skips the files whose size and mtime didn't change, 'link'
+    # hardlinks them when the site is on the same filesystem. With 'link',
+    # editing a file in the site edits its source too. The last two are
+    # opt-in, a file rewritten with the same size in the same second as its
+    # copy isn't copied again on filesystems keeping whole seconds.
+    'media_copy': 'copy',
+
+    # Don't list again the directories of the docs dir whose mtime didn't
+    # change since the last build. Faster on big trees, but a blog edited in
+    # place, without its directory changing, is not rebuilt.
+    'prune_unchanged_dirs': False,
+
+    # Where converted markdown is cached between builds, None disables the
+    # cache. The least recently used entries are dropped past 'cache_size'
+    # megabytes.
+    'cache_dir': '.mkblogs-cache',
+    'cache_size': 100,
+
+    # The zip `mkblogs compile-theme` compiles the templates to. The builds
+    # load them from it, unless the templates changed since.
+    'compiled_theme': 'compiled-theme.zip',
+
+    # Every tag gets pages listing its blogs, 'tags_per_page' blogs a page,
+    # written to 'tags_dir'.
+    'tags_dir': 'tags',
+    'tags_per_page': 50,
+
+    # The blogs past the index are listed on page/2.html, page/3.html, ...
+    # 'archive_per_page' blogs a page.
+    'archive_per_page': 50,
+
+    # The index shows the excerpt of a blog, what comes before a
+    # <!-- more --> line, or its first 'excerpt_paragraphs' paragraphs if it
+    # has none. None shows every paragraph.
+    'excerpt_paragraphs': 3,
 }
 
 def load_config(filename='mkblogs.yml', options=None):
@@ -6,7 +6,7 @@ import logging
 import sys
 
 from mkblogs import __version__
-from mkblogs.build import build
+from mkblogs.build import build, compile_theme, reindex
 from mkblogs.config import load_config
 from mkblogs.exceptions import MkDocsException
 from mkblogs.gh_deploy import gh_deploy
@@ -54,11 +54,17 @@ def main(cmd, args, options=None):
         config = load_config(options=options)
         build(config, clean_site_dir=clean_site_dir)
         gh_deploy(config)
+    elif cmd == 'reindex':
+        config = load_config(options=options)
+        reindex(config)
+    elif cmd == 'compile-theme':
+        config = load_config(options=options)
+        compile_theme(config)
     elif cmd == 'new':
         new(args, options)
     else:
         print('MkDocs (version {0})'.format(__version__))
-        print('mkblogs [help|new|build|serve|gh-deploy|json] {options}')
+        print('mkblogs [help|new|build|serve|gh-deploy|json|reindex|compile-theme] {options}')
 
 
 def run_main():
@@ -0,0 +1,142 @@
+"""
+# Highlight Cache Markdown Extension
+
+With `codehilite` in the markdown extensions, every code block goes through
+Pygments, fenced ones in the `fenced_code` preprocessor, indented ones in the
+`hilite` treeprocessor. This extension puts processors doing the same in
+their place, which look the highlighted html up in the HighlightCache
+`md.highlight_cache` first, so a snippet is highlighted once, not on every
+rebuild of every post it is in.
+
+It has to be loaded after `fenced_code` and `codehilite`, without them or
+without Pygments it does nothing.
+"""
+from __future__ import print_function
+from markdown.extensions import Extension
+from markdown.extensions import codehilite
+from markdown.extensions.codehilite import CodeHilite, HiliteTreeprocessor, \
+        parse_hl_lines
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+
+
+class CachedCodeHilite(CodeHilite):
+    """
+    CodeHilite looking its html up in @cache, a HighlightCache or None
+    """
+    def __init__(self, src=None, cache=None, **options):
+        CodeHilite.__init__(self, src, **options)
+        self.cache = cache
+
+    def options(self):
+        """
+        what the html depends on besides the language and the code
+        """
+        return {
+            'linenums': self.linenums,
+            'guess_lang': self.guess_lang,
+            'css_class': self.css_class,
+            'style': self.style,
+            'noclasses': self.noclasses,
+            'tab_length': self.tab_length,
+            'hl_lines': self.hl_lines,
+        }
+
+    def hilite(self):
+        if self.cache is None or not codehilite.pygments:
+            return CodeHilite.hilite(self)
+        key = self.cache.key(self.lang, self.src, self.options())
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry['html']
+        html = CodeHilite.hilite(self)
+        self.cache.put(key, {'html': html})
+        return html
+
+
+class CachedFencedBlockPreprocessor(FencedBlockPreprocessor):
+
+    def run(self, lines):
+        """
+        FencedBlockPreprocessor.run, highlighting with CachedCodeHilite
+        """
+        if not self.checked_for_codehilite:
+            for ext in self.markdown.registeredExtensions:
+                if isinstance(ext, codehilite.CodeHiliteExtension):
+                    self.codehilite_conf = ext.config
+                    break
+            self.checked_for_codehilite = True
+
+        cache = getattr(self.markdown, 'highlight_cache', None)
+        conf = self.codehilite_conf
+        text = "\n".join(lines)
+        while 1:
+            m = self.FENCED_BLOCK_RE.search(text)
+            if not m:
+                break
+            lang = ''
+            if m.group('lang'):
+                lang = self.LANG_TAG % m.group('lang')
+
+            if conf:
+                highliter = CachedCodeHilite(m.group('code'), cache,
+                        linenums=conf['linenums'][0],
+                        guess_lang=conf['guess_lang'][0],
+                        css_class=conf['css_class'][0],
+                        style=conf['pygments_style'][0],
+                        lang=(m.group('lang') or None),
+                        noclasses=conf['noclasses'][0],
+                        hl_lines=parse_hl_lines(m.group('hl_lines')))
+                code = highliter.hilite()
+            else:
+                code = self.CODE_WRAP % (lang, self._escape(m.group('code')))
+
+            placeholder = self.markdown.htmlStash.store(code, safe=True)
+            text = '%s\n%s\n%s' % (text[:m.start()], placeholder,
+                    text[m.end():])
+        return text.split("\n")
+
+
+class CachedHiliteTreeprocessor(HiliteTreeprocessor):
+
+    def run(self, root):
+        """
+        HiliteTreeprocessor.run, highlighting with CachedCodeHilite
+        """
+        cache = getattr(self.markdown, 'highlight_cache', None)
+        for block in root.getiterator('pre'):
+            children = block.getchildren()
+            if len(children) == 1 and children[0].tag == 'code':
+                code = CachedCodeHilite(children[0].text, cache,
+                        linenums=self.config['linenums'],
+                        guess_lang=self.config['guess_lang'],
+                        css_class=self.config['css_class'],
+                        style=self.config['pygments_style'],
+                        noclasses=self.config['noclasses'],
+                        tab_length=self.markdown.tab_length)
+                placeholder = self.markdown.htmlStash.store(code.hilite(),
+                        safe=True)
+                # Clear codeblock in etree instance
+                block.clear()
+                # Change to p element which will later
+                # be removed when inserting raw html
+                block.tag = 'p'
+                block.text = placeholder
+
+
+class HighlightCacheExtension(Extension):
+    """
+    replaces the processors of fenced_code and codehilite by the cached ones
+    """
+
+    def extendMarkdown(self, md, md_globals):
+        md.highlight_cache = None
+        hilite = md.treeprocessors.get('hilite')
+        if hilite is None:
+            # no highlighting, nothing worth a cache
+            return
+        cached = CachedHiliteTreeprocessor(md)
+        cached.config = hilite.config
+        md.treeprocessors['hilite'] = cached
+        if 'fenced_code_block' in md.preprocessors:
+            md.preprocessors['fenced_code_block'] = \
+                    CachedFencedBlockPreprocessor(md)
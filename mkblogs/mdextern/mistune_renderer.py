@@ -0,0 +1,142 @@
+"""
+# Mistune Renderer
+
+Renders markdown with mistune (0.8) as Python-Markdown renders it with the
+extensions mkblogs always loads:
+
+* the urls are made relative, and the links collected, as the
+  RelativePathExtension does it,
+* the headings get the ids the `toc` extension gives them,
+* fenced code gets the class of the `fenced_code` extension.
+
+The meta block is split off before, see mkblogs.build.meta.split_meta, and
+tables are built in mistune.
+"""
+from __future__ import print_function
+import re
+
+import mistune
+from markdown.extensions.headerid import slugify, unique
+
+from mkblogs.build.excerpt import is_more
+from mkblogs.mdextern.relative_path_ext import rewrite_url
+
+
+TAG_RE = re.compile(r'<[^>]+>')
+ENTITY_RE = re.compile(r'&[\#a-zA-Z0-9]+;')
+
+
+def heading_title(text):
+    """
+    the title of a heading rendered to @text, as the toc extension gets it
+    """
+    text = TAG_RE.sub('', text)
+    #XXX: a bare & is kept, the entities written in the source are dropped,
+    #mistune renders both as &amp;
+    text = text.replace('&amp;', '\x02amp\x03')
+    return ENTITY_RE.sub('', text).replace('\x02amp\x03', '&').strip()
+
+
+def heading_id(title, used_ids):
+    #XXX: markdown 2.4 slugifies a bare & as 'amp'
+    return unique(slugify(title.replace('&', 'amp'), '-'), used_ids)
+
+
+class RelativePathRenderer(mistune.Renderer):
+    """
+    The html renderer of mistune, with the urls made relative to the page and
+    the links, anchors and headings of the document collected as the
+    RelativePathTreeprocessor collects them
+    """
+
+    def __init__(self, **kwargs):
+        mistune.Renderer.__init__(self, **kwargs)
+        self.set_page(None, False)
+
+    def set_page(self, page, strict, prefix=None, links=None):
+        """
+        rebind the page the urls are made relative to, before converting it
+        """
+        self.this_page = page
+        self.strict = strict
+        self.prefix = prefix
+        self.links = links
+        self.linked = []
+        self.refs = []
+        self.anchors = []
+        self.headings = []
+        self.used_ids = set()
+
+    def relative_url(self, url):
+        page = self.this_page
+        new_url, target_file, anchor, rewritten = rewrite_url(url, page,
+                self.prefix, self.links)
+        if target_file is not None:
+            self.linked.append(target_file)
+            self.refs.append((target_file, anchor))
+        elif anchor is not None and page:
+            self.refs.append((page.file_context.current_file, anchor))
+        return new_url
+
+    def header(self, text, level, raw=None):
+        title = heading_title(text)
+        anchor = heading_id(title, self.used_ids)
+        self.anchors.append(anchor)
+        self.headings.append((level, anchor, title))
+        return '<h%d id="%s">%s</h%d>\n' % (level, anchor, text, level)
+
+    def link(self, link, title, text):
+        return mistune.Renderer.link(self, self.relative_url(link), title,
+                text)
+
+    def image(self, src, title, text):
+        src = mistune.escape_link(self.relative_url(src))
+        text = mistune.escape(text, quote=True)
+        if title:
+            title = mistune.escape(title, quote=True)
+            return '<img alt="%s" src="%s" title="%s" />' % (text, src, title)
+        return '<img alt="%s" src="%s" />' % (text, src)
+
+    def block_code(self, code, lang=None):
+        code = code.rstrip('\n')
+        if not lang:
+            code = mistune.escape(code, smart_amp=False)
+            return '<pre><code>%s\n</code></pre>\n' % code
+        code = mistune.escape(code, quote=True, smart_amp=False)
+        return '<pre><code class="%s">%s\n</code></pre>\n' % (lang, code)
+
+
+class ExcerptMarkdown(mistune.Markdown):
+    """
+    mistune.Markdown keeping the (kind, html) of the top level blocks of the
+    last document as `blocks`, the kinds of mkblogs.build.excerpt.block_kind
+    """
+
+    def output(self, text, rules=None):
+        self.tokens = self.block(text, rules)
+        self.tokens.reverse()
+
+        self.inline.setup(self.block.def_links, self.block.def_footnotes)
+
+        self.blocks = []
+        out = self.renderer.placeholder()
+        while self.pop():
+            kind = None
+            if self.token['type'] == 'paragraph':
+                kind = 'p'
+            elif self.token['type'] in ('open_html', 'close_html') and \
+                    is_more(self.token['text']):
+                kind = 'more'
+            html = self.tok()
+            if html:
+                self.blocks.append((kind, html))
+            out += html
+        return out
+
+
+def make_markdown():
+    """
+    an ExcerptMarkdown rendering with a RelativePathRenderer, reachable as
+    `md.renderer`
+    """
+    return ExcerptMarkdown(renderer=RelativePathRenderer(use_xhtml=True))
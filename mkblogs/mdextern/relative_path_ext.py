@@ -25,49 +25,102 @@ tutorial/intro.md   | tutorial/intro.html   | ./img/initial-layout.png     |
 from __future__ import print_function
 import os
 from markdown.extensions import Extension
+from markdown.extensions.headerid import stashedHTML2text
 from markdown.treeprocessors import Treeprocessor
+from markdown.util import AMP_SUBSTITUTE, STX
 
 from mkblogs import utils
 from mkblogs.compat import urlparse, urlunparse
-from mkblogs.exceptions import MarkdownNotFound
+
+
+#the attribute holding the url of the elements with one
+URL_ATTRIBUTES = {'a': 'href', 'img': 'src'}
+
+HEADING_LEVELS = dict(('h%d' % n, n) for n in range(1, 7))
 
 
 def _iter(node):
-    # TODO: Remove when dropping Python 2.6. Replace this
-    # function call with note.iter()
-    return [node] + node.findall('.//*')
+    """
+    walk @node and its descendants without listing them first, Python 2.6
+    elements only have getiterator() which does list them
+    """
+    iterate = getattr(node, 'iter', None) or node.getiterator
+    return iterate()
+
+
+class LinkIndex(object):
+    """
+    What a build knows about links: the markdown files under the docs dir,
+    so links are checked without a syscall, and the urls rewritten so far.
+    It is shared by the threads of a build, a process gets its own copy.
+    """
+    def __init__(self, files=None):
+        """
+        @files are the paths relative to the docs dir of the markdown files,
+        None to look the targets of links up on the disk
+        """
+        self.files = frozenset(files) if files is not None else None
+        # (url, page directory, url directory, prefix) -> rewrite_url()
+        self.urls = {}
 
+    def exists(self, path):
+        if self.files is None:
+            return os.path.exists(path)
+        return path in self.files
 
-def path_to_url(url, page, prefix, strict):
+
+def path_to_url(url, page, prefix, strict, linked=None, links=None):
     """
     convert a path to valid url:
     1) if it is a media file, we change nothing
     2) if it is a md file, we make it to html file
     3) if it is url, we need to parse it
+
+    the markdown files linked by @page are appended to @linked, whether they
+    exist is checked once the whole site is built. With the LinkIndex @links,
+    a url is rewritten once per directory and prefix.
     """
+    new_url, target_file, fragment, rewritten = rewrite_url(url, page, prefix,
+            links)
+    if target_file is not None and linked is not None:
+        linked.append(target_file)
+    return new_url
+
+
+def rewrite_url(url, page, prefix, links=None):
+    """
+    Return (new url, markdown file linked or None, anchor, whether a prefix
+    applies to the url) for @url on @page, see path_to_url. The anchor is the
+    fragment of the links to a markdown file or inside the page, else None.
+    """
+    if links is None:
+        return _rewrite_url(url, page, prefix)
+    if page:
+        key = (url, page.file_context.base_path, page.url_context.base_path,
+                prefix)
+    else:
+        key = (url, None, None, prefix)
+    rewritten = links.urls.get(key)
+    if rewritten is None:
+        rewritten = links.urls[key] = _rewrite_url(url, page, prefix)
+    return rewritten
+
+
+def _rewrite_url(url, page, prefix):
     scheme, netloc, path, params, query, fragment = urlparse(url)
 
-    if scheme or netloc or not path:
-        # Ignore URLs unless they are a relative link to a markdown file.
-        return url
+    if scheme or netloc:
+        return url, None, None, False
+    if not path:
+        # a link inside the page
+        return url, None, fragment or None, False
 
+    target_file = anchor = None
     if page and not utils.is_markdown_file(path):
         path = utils.create_relative_media_url(page.url_context, path)
     elif page:
         target_file = page.file_context.make_absolute(path)
-        if not os.path.exists(target_file):
-            source_file = page.file_context.current_file
-            msg = (
-                #the actual problem is file_context, we cannot check if file
-                #exits if it's path does not start in current dir
-                'The page "%s" contained a hyperlink to "%s" which '
-                'does not exist.'
-            ) % (source_file, target_file)
-            if strict:
-                raise MarkdownNotFound(msg)
-            else:
-                print(msg)
-
+        anchor = fragment or None
         path = utils.get_url_path(target_file)
         path = page.url_context.make_relative(path)
     else:
@@ -78,39 +131,84 @@ def path_to_url(url, page, prefix, strict):
 
     # Convert the .md hyperlink to a relative hyperlink to the HTML page.
     url = urlunparse((scheme, netloc, path, params, query, fragment))
-    return url
+    return url, target_file, anchor, True
 
 
 class RelativePathTreeprocessor(Treeprocessor):
 
-    def __init__(self, page, strict, prefix=None):
+    def __init__(self, page, strict, prefix=None, links=None, md=None):
+        Treeprocessor.__init__(self, md)
         self.this_page = page
         self.strict = strict
         #add a prefix to all url
         self.prefix = prefix
+        #the LinkIndex of the build, if any
+        self.links = links
+        #markdown files linked by the last document
+        self.linked = []
+        #(markdown file, anchor or None) of its internal links
+        self.refs = []
+        #the ids of its elements, which the anchors of links point at
+        self.anchors = []
+        #(level, id, title) of its headings, for its table of contents
+        self.headings = []
+        #(element, attribute) of the urls a prefix applies to
+        self.rewritten = []
 
     def run(self, root):
         """Update urls on anchors and images to make them relative
 
         Iterates through the full document tree looking for specific
-        tags and then makes them relative based on the site navigation
+        tags and then makes them relative based on the site navigation.
+        The links and the ids found are checked once the site is built.
         """
+        self.linked = []
+        self.refs = []
+        self.anchors = []
+        self.headings = []
+        self.rewritten = []
 
+        page = self.this_page
         for element in _iter(root):
-
-            if element.tag == 'a':
-                key = 'href'
-            elif element.tag == 'img':
-                key = 'src'
-            else:
+            anchor = element.get('id')
+            if anchor is None and element.tag == 'a':
+                anchor = element.get('name')
+            if anchor is not None:
+                self.anchors.append(anchor)
+                if element.tag in HEADING_LEVELS:
+                    self.add_heading(element, anchor)
+            key = URL_ATTRIBUTES.get(element.tag)
+            if key is None:
                 continue
-
             url = element.get(key)
-            new_url = path_to_url(url, self.this_page, self.prefix, self.strict)
-            element.set(key, new_url)
+            if url is None:
+                continue
+
+            new_url, target_file, anchor, rewritten = rewrite_url(url, page,
+                    self.prefix, self.links)
+            if target_file is not None:
+                self.linked.append(target_file)
+                self.refs.append((target_file, anchor))
+            elif anchor is not None and page:
+                self.refs.append((page.file_context.current_file, anchor))
+            if rewritten:
+                element.set(key, new_url)
+                self.rewritten.append((element, key))
 
         return root
 
+    def add_heading(self, element, anchor):
+        """
+        keep the heading @element with the id @anchor for the table of
+        contents, its title as the toc extension writes it
+        """
+        title = utils.element_text(element).strip()
+        if STX in title:
+            # raw html, as text
+            title = stashedHTML2text(title, self.markdown)
+        title = title.replace(AMP_SUBSTITUTE, '&')
+        self.headings.append((HEADING_LEVELS[element.tag], anchor, title))
+
 
 class RelativePathExtension(Extension):
     """
@@ -118,14 +216,83 @@ class RelativePathExtension(Extension):
     registers the Treeprocessor.
     """
 
-    def __init__(self, page, strict, prefix=None):
+    def __init__(self, page, strict, prefix=None, links=None):
         self.this_page = page
         self.strict = strict
         self.prefix = prefix
+        self.links = links
+        self.relpath = None
 
     def extendMarkdown(self, md, md_globals):
-        relpath = RelativePathTreeprocessor(self.this_page, self.strict, self.prefix)
-        md.treeprocessors.add("relpath", relpath, "_end")
+        self.relpath = RelativePathTreeprocessor(self.this_page, self.strict,
+                self.prefix, self.links, md)
+        md.treeprocessors.add("relpath", self.relpath, "_end")
+
+    def set_page(self, page, strict, prefix=None, links=None):
+        """
+        rebind the page the urls are made relative to, so one markdown
+        instance can convert many pages, and the LinkIndex @links
+        """
+        self.this_page = page
+        self.strict = strict
+        self.prefix = prefix
+        self.links = links
+        if self.relpath:
+            self.relpath.this_page = page
+            self.relpath.strict = strict
+            self.relpath.prefix = prefix
+            self.relpath.links = links
+            self.relpath.linked = []
+            self.relpath.refs = []
+            self.relpath.anchors = []
+            self.relpath.headings = []
+            self.relpath.rewritten = []
+
+    @property
+    def linked(self):
+        """
+        the markdown files linked by the last converted document
+        """
+        return self.relpath.linked if self.relpath else []
+
+    @property
+    def refs(self):
+        """
+        (markdown file, anchor or None) of the internal links of the last
+        converted document
+        """
+        return self.relpath.refs if self.relpath else []
+
+    @property
+    def anchors(self):
+        """
+        the ids of the elements of the last converted document
+        """
+        return self.relpath.anchors if self.relpath else []
+
+    @property
+    def headings(self):
+        """
+        (level, id, title) of the headings of the last converted document
+        """
+        return self.relpath.headings if self.relpath else []
+
+    @property
+    def rewritten(self):
+        """
+        (element, attribute) of the urls of the last converted document a
+        prefix applies to
+        """
+        return self.relpath.rewritten if self.relpath else []
+
+def prefix_url(url, prefix):
+    """
+    put @prefix before the path of @url, as path_to_url does
+    """
+    scheme, netloc, path, params, query, fragment = urlparse(url)
+    path = os.path.join(prefix, path)
+    return urlunparse((scheme, netloc, path, params, query, fragment))
+
 
 class TitleTreeprocessor(Treeprocessor):
     def run(self, root):
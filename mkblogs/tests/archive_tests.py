@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import jinja2
+
+from mkblogs import utils
+from mkblogs.build import nav
+from mkblogs.build.archive import build_archives, index_page_path, \
+        month_page_path, year_page_path
+from mkblogs.build.manifest import BuildManifest, TrackingEnvironment
+from mkblogs.build.record import RecordStore
+
+
+class ArchiveTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.work_dir)
+        self.env = TrackingEnvironment(loader=jinja2.DictLoader({
+            'base.html': '{% include structure %}',
+            'archive.html': '{{ page_title }}:{% for b in archive_blogs %}'
+                ' {{ b.url }}{% endfor %} {{ previous_url }} {{ next_url }}',
+        }))
+        self.record = RecordStore('.record.db')
+        for n, date in enumerate(['2013-12-01', '2014-01-01', '2014-01-02',
+                '2014-02-01', '2014-02-02'], 1):
+            self.record.put('p%d.md' % n, ['P%d' % n, date, []])
+        self.config = {
+            'record_store': self.record, 'n_blogs_to_show': 1,
+            'archive_per_page': 2, 'docs_dir': '.', 'site_dir': 'site',
+            'site_name': 'test', 'site_favicon': None,
+            'site_description': None, 'site_author': None, 'site_url': None,
+            'extra_javascript': [], 'extra_css': [], 'repo_url': None,
+            'repo_name': None, 'include_nav': True, 'include_next_prev': True,
+            'include_search': False, 'copyright': None,
+            'google_analytics': None,
+        }
+        self.manifest = BuildManifest('.manifest', '.')
+
+    def tearDown(self):
+        self.record.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.work_dir)
+
+    def build(self):
+        build_archives(self.config, nav.SiteNavigation(['index.md']), self.env,
+                self.manifest)
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_paths(self):
+        self.assertEqual(index_page_path(1), 'index.html')
+        self.assertEqual(index_page_path(3), 'page/3.html')
+        self.assertEqual(year_page_path(2014), '2014/index.html')
+        self.assertEqual(year_page_path(2014, 2), '2014/page/2.html')
+        self.assertEqual(month_page_path(2014, 2), '2014/02/index.html')
+        self.assertEqual(month_page_path(2014, 2, 3), '2014/02/page/3.html')
+
+    def test_pages(self):
+        self.build()
+        self.assertEqual(self.read('page/2.html'),
+                'Page 2: ../site/p4.html ../site/p3.html '
+                '../index.html 3.html')
+        self.assertEqual(self.read('page/3.html'),
+                'Page 3: ../site/p2.html ../site/p1.html 2.html None')
+        # the years and months are paginated as the index
+        self.assertEqual(self.read('2014/index.html'),
+                '2014: ../site/p5.html ../site/p4.html None page/2.html')
+        self.assertEqual(self.read('2014/page/2.html'),
+                '2014, page 2: ../../site/p3.html ../../site/p2.html '
+                '../index.html None')
+        self.assertEqual(self.read('2014/02/index.html'),
+                'February 2014: ../../site/p5.html ../../site/p4.html '
+                'None None')
+        self.assertEqual(self.read('2013/12/index.html'),
+                'December 2013: ../../site/p1.html None None')
+
+    def test_links(self):
+        self.env = TrackingEnvironment(loader=jinja2.DictLoader({
+            'base.html': '{% include structure %}',
+            'archive.html': '{% for y in archive_years %}{{ y.url }}'
+                '{% if y.active %}*{% endif %} {% endfor %}|'
+                '{% for m in archive_months %} {{ m.title }} {{ m.url }}'
+                '{% if m.active %}*{% endif %}{% endfor %}',
+        }))
+        self.build()
+        self.assertEqual(self.read('page/2.html'), '|')
+        self.assertEqual(self.read('2014/index.html'),
+                'index.html* ../2013/index.html |'
+                ' February 02/index.html January 01/index.html')
+        # a month links to the months next to it only
+        self.assertEqual(self.read('2014/02/index.html'),
+                '../index.html |'
+                ' February index.html* January ../01/index.html')
+        self.assertEqual(self.read('2014/01/index.html'),
+                '../index.html |'
+                ' February ../02/index.html January index.html*'
+                ' December 2013 ../../2013/12/index.html')
+
+    def test_incremental(self):
+        self.build()
+        self.config['changed_blogs'] = set()
+        os.remove('2014/index.html')
+        self.build()
+        # only the page missing is rendered again
+        self.assertTrue(os.path.exists('2014/index.html'))
+        os.utime('page/3.html', (0, 0))
+
+        # a blog renamed renders the pages listing it
+        self.record.put('p4.md', ['Q4', '2014-02-01', []])
+        self.config['changed_blogs'] = set(['p4.md'])
+        self.build()
+        self.assertEqual(os.path.getmtime('page/3.html'), 0)
+        os.utime('2014/02/index.html', (0, 0))
+
+        # the blog of December gone, its pages are removed, the pages of the
+        # index after it change
+        self.record.remove('p1.md')
+        self.config['changed_blogs'] = set(['p1.md'])
+        self.build()
+        self.assertFalse(os.path.exists('2013'))
+        self.assertEqual(self.read('page/3.html'),
+                'Page 3: ../site/p2.html 2.html None')
+        self.assertEqual(os.path.getmtime('2014/02/index.html'), 0)
+
+        # a new month renders its year, the pages after it and the month
+        # next to it, February, not January
+        self.record.put('p6.md', ['P6', '2014-04-01', []])
+        self.config['changed_blogs'] = set(['p6.md'])
+        self.config['build_stats'] = stats = utils.AtomicCounter()
+        self.build()
+        self.assertTrue(os.path.exists('2014/04/index.html'))
+        self.assertEqual(stats['written'] + stats['unchanged'], 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import io
+import os
+import re
+import unittest
+
+from mkblogs.build import html, nav
+from mkblogs.exceptions import ConfigurationError
+from mkblogs.tests.base import dedent
+
+
+def normalize(html_content):
+    """
+    the html without the whitespace around tags, the backends place newlines
+    differently
+    """
+    return re.sub(r'\s*(<[^>]+>)\s*', r'\1', html_content).strip()
+
+
+def convert(source, backend):
+    page = nav.Blog('/2014/post.html', '2014/post.md')
+    linked, refs, anchors, excerpts = [], [], [], []
+    content, toc, meta = html.convert_markdown(source, page=page,
+            linked=linked, refs=refs, anchors=anchors, backend=backend,
+            excerpt_paragraphs=2, excerpts=excerpts)
+    toc = [(item.title, item.url, [child.url for child in item.children])
+            for item in toc]
+    excerpt, more = excerpts[0]
+    return content, normalize(excerpt), more, toc, meta, linked, refs, \
+            anchors
+
+
+class BackendTests(unittest.TestCase):
+
+    def test_default_backend(self):
+        self.assertTrue(isinstance(html.get_backend(), html.MarkdownBackend))
+        self.assertEqual(html.get_backend('markdown').name, 'markdown')
+
+    def test_unknown_backend(self):
+        self.assertRaises(ConfigurationError, html.get_backend, 'nope')
+
+    def test_extensions_need_markdown(self):
+        backend = html.get_backend('mistune', ['smart_strong'])
+        self.assertEqual(backend.name, 'markdown')
+
+
+@unittest.skipIf(not html.MistuneBackend.available(),
+        'mistune 0.8 is not installed')
+class ConformanceTests(unittest.TestCase):
+    """
+    the mistune backend converts the test corpus as Python-Markdown does
+    """
+
+    corpus = [
+        dedent("""
+            title: A post
+            date: 2014-01-02
+            tags: a
+                b
+
+            # Heading 1
+            Some *text* and `code`, a [link](other.md#top) and
+            ![an image](img/a.png "title").
+
+            ## <em>Raw</em> 2 `code`
+
+            ```python
+            print("x < y")
+            ```
+
+                indented & code
+
+            # Heading 1
+            - one
+            - [two](#heading-1)
+
+            > Tom & Jerry, [out](http://example.com/a.md)
+        """).lstrip(),
+        dedent("""
+            Title: More
+
+            intro
+
+            <!-- more -->
+
+            after
+        """).lstrip(),
+        dedent("""
+            Title: Tables
+
+            a | b
+            --|--
+            1 | [2](../up.md)
+
+            ### Deep
+            1. [Home](/index.md)
+            2. ![a](/img/b.png)
+        """).lstrip(),
+        '',
+    ]
+
+    def test_same_fragments(self):
+        for source in self.corpus:
+            expected = convert(source, 'markdown')
+            converted = convert(source, 'mistune')
+            self.assertEqual(normalize(converted[0]), normalize(expected[0]))
+            self.assertEqual(converted[1:], expected[1:])
+
+    def test_test_md(self):
+        path = os.path.join(os.path.dirname(__file__), 'test.md')
+        with io.open(path, encoding='utf-8') as f:
+            source = f.read()
+        # the raw html of the page is laid out differently, not its meta,
+        # links and headings
+        self.assertEqual(convert(source, 'mistune')[2:],
+                convert(source, 'markdown')[2:])
+
+    def test_not_rendered_again(self):
+        html.convert_markdown('[link](other.md)', backend='mistune')
+        self.assertEqual(html.render_excerpt('site'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+
+from mkblogs.build import build_blogs
+
+
+class RecordDeltaTests(unittest.TestCase):
+
+    def setUp(self):
+        self.old = {
+            'old.md': ['Old', '01 Jan 2014', ['a']],
+            'new.md': ['New', '01 Jan 2015', ['b']],
+        }
+
+    def dirty(self, new, rebuilt=()):
+        delta = build_blogs.record_delta(self.old, new)
+        return build_blogs.dirty_pages(delta, ['new.md'], ['new.md'], rebuilt)
+
+    def test_no_change(self):
+        self.assertEqual(build_blogs.record_delta(self.old, dict(self.old)), {})
+        self.assertEqual(self.dirty(dict(self.old)), set())
+
+    def test_body_edit_of_old_blog(self):
+        self.assertEqual(self.dirty(dict(self.old), rebuilt=['old.md']), set())
+
+    def test_body_edit_of_index_blog(self):
+        self.assertEqual(self.dirty(dict(self.old), rebuilt=['new.md']),
+                set(['Home']))
+
+    def test_title_change(self):
+        new = dict(self.old)
+        new['old.md'] = ['Older', '01 Jan 2014', ['a']]
+        self.assertEqual(self.dirty(new), set(['Catalogs']))
+
+    def test_removed_blog(self):
+        new = dict(self.old)
+        del new['old.md']
+        delta = build_blogs.record_delta(self.old, new)
+        self.assertEqual(delta, {'old.md': (self.old['old.md'], None)})
+        self.assertEqual(self.dirty(new), set(['Catalogs']))
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mkblogs.build import html, nav
+from mkblogs.build.build_pages import get_environment
+from mkblogs.build.cache import FragmentCache, open_cache, \
+        pygments_version
+
+
+class FragmentCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = FragmentCache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_key(self):
+        key = self.cache.key(u'# a')
+        self.assertEqual(key, self.cache.key(u'# a'))
+        self.assertNotEqual(key, self.cache.key(u'# b'))
+        self.assertNotEqual(key, self.cache.key(u'# a', ['smart_strong']))
+        self.assertNotEqual(key, self.cache.key(u'# a', prefix='site'))
+        page = nav.Blog('/2014/post.html', '2014/post.md')
+        self.assertNotEqual(key, self.cache.key(u'# a', page=page))
+
+    def test_convert_is_cached(self):
+        content, toc, meta = html.convert_markdown(u'title: a\n\n# Head',
+                cache=self.cache)
+        self.assertEqual(meta, {'title': ['a']})
+        # the conversion is not done again, a stored fragment is returned
+        key = self.cache.key(u'title: a\n\n# Head')
+        fragment = self.cache.get(key)
+        fragment['html'] = u'<h1>cached</h1>'
+        self.cache.put(key, fragment)
+        cached, toc, meta = html.convert_markdown(u'title: a\n\n# Head',
+                cache=self.cache)
+        self.assertEqual(cached, u'<h1>cached</h1>')
+        self.assertEqual(meta, {'title': ['a']})
+        self.assertEqual([item.title for item in toc], ['Head'])
+
+    def test_links_are_kept(self):
+        page = nav.Blog('/post.html', os.path.join(self.cache_dir, 'post.md'))
+        missing = os.path.join(self.cache_dir, 'missing.md')
+        for n in range(2):
+            # converted then from the cache
+            linked, refs, anchors = [], [], []
+            html.convert_markdown(u'# A\n[a](missing.md#x)', page,
+                    linked=linked, cache=self.cache, refs=refs,
+                    anchors=anchors)
+            self.assertEqual(linked, [missing])
+            self.assertEqual(refs, [(missing, 'x')])
+            self.assertEqual(anchors, ['a'])
+
+    def test_trim(self):
+        cache = FragmentCache(self.cache_dir, max_size=150)
+        for n in range(3):
+            key = cache.key(u'%d' % n)
+            cache.put(key, {'html': 'x' * 50})
+            os.utime(cache.path(key), (time.time() - 100 + n,) * 2)
+        # reading an entry makes it the most recently used
+        cache.get(cache.key(u'0'))
+        self.assertEqual(cache.trim(), 1)
+        self.assertTrue(cache.get(cache.key(u'0')))
+        self.assertEqual(cache.get(cache.key(u'1')), None)
+        self.assertTrue(cache.get(cache.key(u'2')))
+        # nothing written since, the cache isn't listed again
+        cache.max_size = 50
+        self.assertEqual(cache.trim(), 0)
+        cache.highlights.put(cache.highlights.key('c', u'x', {}),
+                {'html': 'x'})
+        self.assertEqual(cache.trim(), 2)
+
+    def test_cache_size_option(self):
+        cache = open_cache({'cache_dir': self.cache_dir, 'cache_size': '0.5'})
+        self.assertEqual(cache.max_size, 512 * 1024)
+
+
+@unittest.skipIf(pygments_version() is None, 'Pygments is not installed')
+class HighlightCacheTests(unittest.TestCase):
+
+    snippet = u'def f(x):\n    return x < 1\n'
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = FragmentCache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def convert(self, source):
+        return html.convert_markdown(source, extensions=['codehilite'],
+                cache=self.cache)[0]
+
+    def test_key(self):
+        highlights = self.cache.highlights
+        key = highlights.key('python', self.snippet, {'linenums': None})
+        self.assertNotEqual(key, highlights.key('c', self.snippet,
+            {'linenums': None}))
+        self.assertNotEqual(key, highlights.key('python', self.snippet,
+            {'linenums': True}))
+
+    def test_snippets_are_shared(self):
+        fenced = u'```python\n%s```\n' % self.snippet
+        indented = u'    :::python\n' + u''.join(u'    ' + line + u'\n'
+                for line in self.snippet.splitlines())
+        highlights = self.cache.highlights
+        for source in (fenced, indented):
+            first = self.convert(u'# One\n\n' + source)
+            self.assertTrue('class="codehilite"' in first)
+            keys = []
+            for dirpath, dirnames, filenames in os.walk(highlights.directory):
+                keys.extend(os.path.basename(dirpath) + name
+                        for name in filenames)
+            self.assertEqual(len(keys), 1)
+            highlights.put(keys[0], {'html': u'<p>cached</p>'})
+            # the snippet in another post is not highlighted again
+            second = self.convert(u'# Two\n\n' + source)
+            self.assertTrue('<p>cached</p>' in second)
+            shutil.rmtree(highlights.directory)
+
+
+class EnvironmentTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.templates_dir = os.path.join(self.directory, 'theme')
+        os.mkdir(self.templates_dir)
+        self.write('base.html', u'{{ page }}')
+        self.config = {
+            'templates_dir': [self.templates_dir],
+            'cache_dir': os.path.join(self.directory, 'cache'),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        with open(os.path.join(self.templates_dir, name), 'w') as f:
+            f.write(text)
+
+    def test_shared(self):
+        env = get_environment(self.config)
+        self.assertTrue(get_environment(dict(self.config)) is env)
+        self.assertTrue(get_environment(self.config, new_session=True) is env)
+        other = dict(self.config, tags_dir='labels')
+        self.assertFalse(get_environment(other) is env)
+
+    def test_bytecode_cache(self):
+        env = get_environment(self.config)
+        self.assertEqual(env.get_template('base.html').render(page='a'), 'a')
+        bytecode_dir = os.path.join(self.config['cache_dir'], 'jinja')
+        self.assertEqual(len(os.listdir(bytecode_dir)), 1)
+
+    def test_new_session(self):
+        env = get_environment(self.config)
+        template = env.get_template('base.html')
+        self.write('base.html', u'<p>{{ page }}</p>')
+        self.assertTrue(env.get_template('base.html') is template)
+        env = get_environment(self.config, new_session=True)
+        self.assertEqual(env.get_template('base.html').render(page='a'),
+                '<p>a</p>')
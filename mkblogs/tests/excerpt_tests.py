@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+
+from mkblogs.build import html, nav
+from mkblogs.build.excerpt import excerpt_cut
+from mkblogs.tests.base import dedent
+
+
+class ExcerptTests(unittest.TestCase):
+
+    source = dedent("""
+        title: A post
+
+        # Heading
+
+        one [link](other.md)
+
+        <div>raw</div>
+
+        two
+
+        three
+    """)
+
+    def excerpt(self, source, **kwargs):
+        excerpts = []
+        html.convert_markdown(source, excerpts=excerpts, **kwargs)
+        return excerpts[0]
+
+    def test_cut(self):
+        self.assertEqual(excerpt_cut([None, 'p', 'p', 'p', 'p']), (4, True))
+        self.assertEqual(excerpt_cut([None, 'p', 'p'], 3), (3, False))
+        self.assertEqual(excerpt_cut(['p', 'more', 'p', 'p'], 1), (1, True))
+        self.assertEqual(excerpt_cut(['p', 'p', 'more'], 1), (2, False))
+        self.assertEqual(excerpt_cut(['p', 'p', 'p'], None), (3, False))
+        self.assertEqual(excerpt_cut([]), (0, False))
+
+    def test_first_paragraphs(self):
+        self.assertEqual(self.excerpt(self.source, excerpt_paragraphs=2), (
+            '<h1 id="heading">Heading</h1>\n'
+            '<p>one <a href="other.html">link</a></p>\n'
+            '<div>raw</div>\n\n'
+            '<p>two</p>', True))
+        self.assertEqual(self.excerpt(self.source, excerpt_paragraphs=None),
+                (html.convert_markdown(self.source)[0], False))
+
+    def test_more_marker(self):
+        source = self.source.replace('two', '<!-- more -->\n\ntwo')
+        self.assertEqual(self.excerpt(source, excerpt_paragraphs=1), (
+            '<h1 id="heading">Heading</h1>\n'
+            '<p>one <a href="other.html">link</a></p>\n'
+            '<div>raw</div>', True))
+        self.assertEqual(self.excerpt(u''), (u'', False))
+
+    def test_render_excerpt(self):
+        page = nav.Blog('/2014/post.html', '2014/post.md')
+        excerpts = []
+        html.convert_markdown(self.source, page, excerpt_paragraphs=1)
+        excerpt = html.render_excerpt('site/2014')
+        # the tree is used once
+        self.assertEqual(html.render_excerpt('site/2014'), None)
+        html.convert_markdown(self.source, page, prefix='site/2014',
+                excerpts=excerpts, excerpt_paragraphs=1)
+        self.assertEqual(excerpt, excerpts[0])
+        self.assertTrue('site/2014/other.html' in excerpt[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+from mkblogs import utils
+
+
+class WriteFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.site_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.site_dir, 'sub', 'page.html')
+
+    def tearDown(self):
+        shutil.rmtree(self.site_dir)
+
+    def test_new_file(self):
+        self.assertTrue(utils.write_file(b'<p>a</p>', self.output))
+        self.assertEqual(open(self.output, 'rb').read(), b'<p>a</p>')
+
+    def test_unchanged_file(self):
+        utils.write_file(b'<p>a</p>', self.output)
+        os.utime(self.output, (0, 0))
+        self.assertFalse(utils.write_file(b'<p>a</p>', self.output))
+        self.assertEqual(os.path.getmtime(self.output), 0)
+
+    def test_changed_file(self):
+        utils.write_file(b'<p>a</p>', self.output)
+        self.assertTrue(utils.write_file(b'<p>b</p>', self.output))
+        self.assertEqual(open(self.output, 'rb').read(), b'<p>b</p>')
+
+    def test_known_digest(self):
+        utils.write_file(b'<p>a</p>', self.output)
+        digest = utils.content_digest(b'<p>a</p>')
+        self.assertEqual(digest, utils.file_digest(self.output))
+        self.assertFalse(utils.write_file(b'<p>a</p>', self.output, digest))
+        # a stale digest means the file was changed since, write it
+        self.assertTrue(utils.write_file(b'<p>b</p>', self.output, digest))
+
+
+class CopyMediaTests(unittest.TestCase):
+
+    def setUp(self):
+        self.docs_dir = tempfile.mkdtemp()
+        self.site_dir = tempfile.mkdtemp()
+        for path, content in [('a.png', b'png'), ('img/b.css', b'body {}'),
+                ('post.md', b'# post'), ('.hidden', b'x')]:
+            path = os.path.join(self.docs_dir, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.docs_dir)
+        shutil.rmtree(self.site_dir)
+
+    def site_file(self, path):
+        return os.path.join(self.site_dir, path)
+
+    def test_copy(self):
+        copied, skipped = utils.copy_media_files(self.docs_dir, self.site_dir,
+                'copy', 2)
+        self.assertEqual((copied, skipped), (10, 0))
+        self.assertEqual(open(self.site_file('img/b.css'), 'rb').read(),
+                b'body {}')
+        self.assertFalse(os.path.exists(self.site_file('post.md')))
+        self.assertFalse(os.path.exists(self.site_file('.hidden')))
+        # plain copies copy everything again
+        self.assertEqual(utils.copy_media_files(self.docs_dir, self.site_dir),
+                (10, 0))
+
+    def test_incremental(self):
+        utils.copy_media_files(self.docs_dir, self.site_dir, 'incremental', 2)
+        self.assertEqual(int(os.path.getmtime(self.site_file('a.png'))),
+                int(os.path.getmtime(os.path.join(self.docs_dir, 'a.png'))))
+        self.assertEqual(utils.copy_media_files(self.docs_dir, self.site_dir,
+            'incremental', 2), (0, 10))
+
+        source = os.path.join(self.docs_dir, 'img/b.css')
+        with open(source, 'wb') as f:
+            f.write(b'body {x}')
+        self.assertEqual(utils.copy_media_files(self.docs_dir, self.site_dir,
+            'incremental', 2), (8, 3))
+        self.assertEqual(open(self.site_file('img/b.css'), 'rb').read(),
+                b'body {x}')
+
+        # the same size in the same second is copied again
+        mtime = int(os.path.getmtime(source))
+        with open(source, 'wb') as f:
+            f.write(b'body {y}')
+        os.utime(source, (mtime + 0.5, mtime + 0.5))
+        os.utime(self.site_file('img/b.css'), (mtime, mtime))
+        self.assertEqual(utils.copy_media_files(self.docs_dir, self.site_dir,
+            'incremental', 2), (8, 3))
+        self.assertEqual(open(self.site_file('img/b.css'), 'rb').read(),
+                b'body {y}')
+
+    def test_link(self):
+        utils.copy_media_files(self.docs_dir, self.site_dir, 'link', 2)
+        self.assertTrue(os.path.samefile(self.site_file('a.png'),
+            os.path.join(self.docs_dir, 'a.png')))
+        self.assertEqual(utils.copy_media_files(self.docs_dir, self.site_dir,
+            'link', 2), (0, 10))
+
+    def test_link_across_filesystems(self):
+        def cross_device_link(source, link_name):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        link, os.link = os.link, cross_device_link
+        try:
+            self.assertEqual(utils.copy_media_files(self.docs_dir,
+                self.site_dir, 'link', 2), (10, 0))
+            self.assertFalse(os.path.samefile(self.site_file('a.png'),
+                os.path.join(self.docs_dir, 'a.png')))
+            # the copies are not made again
+            self.assertEqual(utils.copy_media_files(self.docs_dir,
+                self.site_dir, 'link', 2), (0, 10))
+        finally:
+            os.link = link
+
+    def test_error(self):
+        os.makedirs(self.site_file('a.png'))
+        self.assertRaises(Exception, utils.copy_media_files,
+                self.docs_dir, self.site_dir, 'incremental', 2)
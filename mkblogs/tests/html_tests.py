@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+
+from mkblogs.build import html, nav
+from mkblogs.mdextern.relative_path_ext import LinkIndex
+from mkblogs.tests.base import dedent
+
+
+class MarkdownEngineTests(unittest.TestCase):
+
+    def test_engine_is_reused(self):
+        md = html.get_markdown()
+        self.assertTrue(md is html.get_markdown())
+        self.assertFalse(md is html.get_markdown(['smart_strong']))
+
+    def test_meta_does_not_leak(self):
+        html.convert_markdown(dedent("""
+            title: first
+
+            # Heading 1
+        """))
+        content, toc, meta = html.convert_markdown("")
+        self.assertEqual(content, '')
+        self.assertEqual(meta, {})
+        self.assertEqual(len(list(toc)), 0)
+
+    def test_prefix_is_rebound(self):
+        md_text = '[link](other.md)'
+        content, _, _ = html.convert_markdown(md_text, prefix='site')
+        self.assertEqual(content, '<p><a href="site/other.html">link</a></p>')
+        content, _, _ = html.convert_markdown(md_text)
+        self.assertEqual(content, '<p><a href="other.html">link</a></p>')
+
+    def test_toc_from_headings(self):
+        md_text = dedent("""
+            # Heading 1
+            ### Deep
+            ## <em>Raw</em> 2 `code`
+            # Last
+        """)
+        content, toc, meta = html.convert_markdown(md_text)
+        # nothing is made until a template looks at it
+        self.assertEqual(toc._items, None)
+        self.assertEqual(str(toc).strip(), dedent("""
+            Heading 1 - #heading-1
+                Deep - #deep
+                Raw 2 code - #raw-2-code
+            Last - #last
+        """).strip())
+        self.assertTrue(list(toc)[0].active)
+
+
+class LinkIndexTests(unittest.TestCase):
+
+    md_text = dedent("""
+        [up](../other.md#top) [here](post.md) [gone](gone.md)
+        ![img](img/a.png) [out](http://example.com/a.md) <a name="x"></a>
+    """)
+
+    def test_same_as_without(self):
+        links = LinkIndex(['other.md', '2014/post.md', '2014/gone.md'])
+        for prefix in (None, 'site/2014'):
+            page = nav.Blog('/2014/post.html', '2014/post.md')
+            linked = []
+            content, _, _ = html.convert_markdown(self.md_text, page,
+                    prefix=prefix, linked=linked, links=links)
+            expected, _, _ = html.convert_markdown(self.md_text, page,
+                    prefix=prefix, links=LinkIndex(links.files))
+            self.assertEqual(content, expected)
+            self.assertEqual(linked, ['other.md', '2014/post.md',
+                '2014/gone.md'])
+        # the urls of a directory and prefix are rewritten once
+        self.assertEqual(len(links.urls), 10)
+        self.assertEqual(links.urls[('img/a.png', '2014', '/2014', None)],
+                ('./img/a.png', None, None, True))
+
+    def test_refs_and_anchors(self):
+        page = nav.Blog('/2014/post.html', '2014/post.md')
+        refs, anchors = [], []
+        html.convert_markdown(u'# Head\n\n[in](#head) ' + self.md_text, page,
+                refs=refs, anchors=anchors)
+        self.assertEqual(refs, [('2014/post.md', 'head'), ('other.md', 'top'),
+            ('2014/post.md', None), ('2014/gone.md', None)])
+        # the raw html is not looked into
+        self.assertEqual(anchors, ['head'])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mkblogs.build.links import check_links, LinkGraph
+from mkblogs.exceptions import MarkdownNotFound
+from mkblogs.mdextern.relative_path_ext import LinkIndex
+
+
+class LinkGraphTests(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = LinkGraph()
+        self.graph.add('a.md', [('b.md', 'head'), ('b.md', 'gone'),
+            ('a.md', 'top'), ('c.md', None), ('index.md', 'x')], ['top'])
+        self.graph.add('b.md', [('a.md', None), ('a.md', 'nowhere')],
+                ['head'])
+
+    def test_broken(self):
+        # index.md is a file of the site, but its anchors are unknown
+        self.assertEqual(self.graph.broken(set(['index.md'])), [
+            {'source': 'a.md', 'target': 'b.md', 'anchor': 'gone',
+                'reason': 'missing anchor'},
+            {'source': 'a.md', 'target': 'c.md', 'anchor': None,
+                'reason': 'missing page'},
+            {'source': 'b.md', 'target': 'a.md', 'anchor': 'nowhere',
+                'reason': 'missing anchor'},
+        ])
+
+    def test_update_keeps_the_pages_converted(self):
+        self.graph.update({'b.md': ([], []), 'c.md': ([], [])})
+        self.assertEqual(self.graph.sources['b.md'][1], ['head'])
+        self.assertEqual(len(self.graph.broken(set(['index.md']))), 2)
+
+
+class CheckLinksTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.report = os.path.join(self.work_dir, 'links.json')
+        graph = LinkGraph()
+        graph.add('a.md', [('b.md', None), ('a.md', 'top')], [])
+        self.config = {
+            'link_graph': graph,
+            'link_index': LinkIndex(['a.md']),
+            'link_report': self.report,
+            'strict': False,
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_report(self):
+        check_links(self.config)
+        with open(self.report) as f:
+            report = json.load(f)
+        self.assertEqual(report['pages'], 1)
+        self.assertEqual(report['links'], 2)
+        self.assertEqual([link['reason'] for link in report['broken']],
+                ['missing page', 'missing anchor'])
+
+    def test_strict(self):
+        self.config['strict'] = True
+        self.assertRaises(MarkdownNotFound, check_links, self.config)
+        # the report is written anyway
+        self.assertTrue(os.path.exists(self.report))
+
+
+if __name__ == '__main__':
+    unittest.main()
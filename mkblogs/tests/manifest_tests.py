@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mkblogs.build.manifest import BuildManifest
+
+
+class BuildManifestTests(unittest.TestCase):
+
+    def setUp(self):
+        self.docs_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.docs_dir, '.manifest')
+        self.write('post.md', 'title: post\n\nsome text\n')
+        self.write('post.html', '<p>some text</p>')
+
+    def tearDown(self):
+        shutil.rmtree(self.docs_dir)
+
+    def write(self, path, content):
+        with open(os.path.join(self.docs_dir, path), 'w') as f:
+            f.write(content)
+
+    def touch(self, path):
+        later = time.time() + 10
+        os.utime(os.path.join(self.docs_dir, path), (later, later))
+
+    def saved_manifest(self):
+        manifest = BuildManifest(self.filename, self.docs_dir, 'toolchain')
+        self.assertFalse(manifest.is_fresh('post.md'))
+        manifest.record('post.md', 'post.html')
+        manifest.save()
+        return BuildManifest(self.filename, self.docs_dir, 'toolchain')
+
+    def test_unchanged(self):
+        self.assertTrue(self.saved_manifest().is_fresh('post.md'))
+
+    def test_touched_but_same_content(self):
+        manifest = self.saved_manifest()
+        self.touch('post.md')
+        self.assertTrue(manifest.is_fresh('post.md'))
+
+    def test_changed_content(self):
+        manifest = self.saved_manifest()
+        self.write('post.md', 'title: post\n\nsome TEXT\n')
+        self.touch('post.md')
+        self.assertFalse(manifest.is_fresh('post.md'))
+
+    def test_missing_output(self):
+        manifest = self.saved_manifest()
+        os.unlink(os.path.join(self.docs_dir, 'post.html'))
+        self.assertFalse(manifest.is_fresh('post.md'))
+
+    def test_toolchain_changed(self):
+        self.saved_manifest()
+        manifest = BuildManifest(self.filename, self.docs_dir, 'new toolchain')
+        self.assertFalse(manifest.is_fresh('post.md'))
+
+
+class DependencyTests(unittest.TestCase):
+
+    def setUp(self):
+        self.docs_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.docs_dir, '.manifest')
+        self.template = os.path.join(self.docs_dir, 'base.html')
+        for path in ('post.md', 'post.html', 'base.html'):
+            open(os.path.join(self.docs_dir, path), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.docs_dir)
+
+    def manifest(self, config_digest='config'):
+        return BuildManifest(self.filename, self.docs_dir, 'toolchain',
+                config_digest)
+
+    def save(self, links=()):
+        manifest = self.manifest()
+        manifest.record('post.md', 'post.html', {
+            'templates': [self.template],
+            'links': list(links),
+        })
+        manifest.save()
+
+    def test_unchanged(self):
+        self.save()
+        self.assertTrue(self.manifest().is_fresh('post.md'))
+
+    def test_config_changed(self):
+        self.save()
+        self.assertFalse(self.manifest('new config').is_fresh('post.md'))
+
+    def test_template_changed(self):
+        self.save()
+        with open(self.template, 'w') as f:
+            f.write('{{ content }}')
+        self.assertFalse(self.manifest().is_fresh('post.md'))
+
+    def test_linked_file_created(self):
+        # the links are relative to the docs dir, as build_blogs records them
+        os.mkdir(os.path.join(self.docs_dir, '2014'))
+        self.save(links=['2014/other.md', 'post.md'])
+        self.assertTrue(self.manifest().is_fresh('post.md'))
+        open(os.path.join(self.docs_dir, '2014', 'other.md'), 'w').close()
+        self.assertFalse(self.manifest().is_fresh('post.md'))
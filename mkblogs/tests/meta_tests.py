@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import markdown
+
+from mkblogs.build.meta import meta_entry, read_meta
+
+
+class ReadMetaTests(unittest.TestCase):
+
+    sources = [
+        u'title: A Post\ndate: 2014-01-02\ntags: a\n    b\n\n# Body\nx: y\n',
+        u'Title: Upper\n  Date: 02 Jan 2014\nBlank:\n\nbody',
+        u'title: Continued\n    not a key: here\nnext:\tvalue\n# body\n',
+        u'title: été à Paris\r\ndate: 2014-01-02\r\n\r\nbody',
+        u'    code, not meta\n',
+        u'title: only meta',
+        u'# no meta\n\ntitle: x\n',
+    ]
+
+    def setUp(self):
+        self.docs_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.docs_dir)
+
+    def write(self, source):
+        path = os.path.join(self.docs_dir, 'post.md')
+        with open(path, 'wb') as f:
+            f.write(source.encode('utf-8'))
+        return path
+
+    def test_same_as_markdown(self):
+        for source in self.sources:
+            md = markdown.Markdown(extensions=['meta'])
+            md.convert(source)
+            path = self.write(source)
+            # blocks ending inside a line or a character
+            for block_size in (4096, 7, 1):
+                self.assertEqual(read_meta(path, block_size), md.Meta)
+
+    def test_entry(self):
+        self.assertEqual(meta_entry({'title': ['A'],
+            'date': ['2014-01-02']})[0], ['A', '02 Jan 2014', ['NO TAGS']])
+        entry, sort_key = meta_entry({'title': ['A'], 'date': ['2014-01-02'],
+            'tags': ['x', 'y']})
+        self.assertEqual(entry[2], ['x', 'y'])
+        self.assertTrue(sort_key > meta_entry({'title': ['B'],
+            'date': ['2014-01-01']})[1])
+        self.assertRaises(NameError, meta_entry, {'title': ['A']})
+        self.assertRaises(NameError, meta_entry, {'title': [],
+            'date': ['2014-01-02']})
+        # the callers log a bad date and skip the blog
+        self.assertRaises(ValueError, meta_entry, {'title': ['A'],
+            'date': ['not a date']})
+
+
+if __name__ == '__main__':
+    unittest.main()
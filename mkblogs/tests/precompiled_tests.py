@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mkblogs.build.build_pages import compile_theme, get_environment
+from mkblogs.build.precompiled import PrecompiledLoader, info_path, \
+        theme_loader
+from mkblogs.exceptions import ConfigurationError
+
+
+class PrecompiledTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.templates_dir = os.path.join(self.directory, 'theme')
+        os.mkdir(self.templates_dir)
+        self.write('base.html', u'{% include "nav.html" %} {{ page }}')
+        self.write('nav.html', u'<a href="{{ "a-b"|tag_page }}">nav</a>')
+        self.config = {
+            'templates_dir': [self.templates_dir],
+            'compiled_theme': os.path.join(self.directory, 'theme.zip'),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        with open(os.path.join(self.templates_dir, name), 'w') as f:
+            f.write(text)
+
+    def test_no_compiled_theme(self):
+        self.assertFalse(isinstance(theme_loader(self.config),
+            PrecompiledLoader))
+        self.assertRaises(ConfigurationError, compile_theme,
+                dict(self.config, compiled_theme=None))
+
+    def test_compiled(self):
+        compile_theme(self.config)
+        self.assertTrue(os.path.isfile(info_path(
+            self.config['compiled_theme'])))
+        loader = theme_loader(self.config)
+        self.assertTrue(isinstance(loader, PrecompiledLoader))
+        self.assertTrue(theme_loader(self.config, loader) is loader)
+
+        env = get_environment(self.config, new_session=True)
+        self.assertTrue(isinstance(env.loader, PrecompiledLoader))
+        with env.record_templates() as templates:
+            html = env.get_template('base.html').render(page='a')
+        self.assertEqual(html, '<a href="tags/a-b.html">nav</a> a')
+        # the sources are what the outputs depend on
+        self.assertEqual(templates, set(os.path.join(self.templates_dir,
+            name) for name in ('base.html', 'nav.html')))
+
+    def test_stale(self):
+        compile_theme(self.config)
+        self.write('nav.html', u'<p>nav</p>')
+        self.assertFalse(isinstance(theme_loader(self.config),
+            PrecompiledLoader))
+        env = get_environment(self.config, new_session=True)
+        self.assertEqual(env.get_template('base.html').render(page='a'),
+                '<p>nav</p> a')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from mkblogs import utils
+from mkblogs.build.record import RecordStore
+
+
+class RecordStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.docs_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.docs_dir, '.record.db')
+        self.json_record = os.path.join(self.docs_dir, '.record')
+        self.record = {
+            'a.md': ['A', '01 Jan 2014', ['x', 'y']],
+            'b.md': ['B', '03 Jan 2014', ['y']],
+            'c.md': ['C', '02 Jan 2014', ['NO TAGS']],
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.docs_dir)
+
+    def store(self):
+        store = RecordStore(self.filename)
+        for path, entry in self.record.items():
+            store.put(path, entry)
+        store.commit()
+        return store
+
+    def test_entries(self):
+        store = self.store()
+        self.assertEqual(store.load(), self.record)
+        self.assertEqual(store.get('a.md'), ['A', '01 Jan 2014', ['x', 'y']])
+        self.assertEqual(store.get('d.md'), None)
+        self.assertEqual(store.paths(), set(self.record))
+        self.assertEqual(len(store), 3)
+
+    def test_put_and_remove(self):
+        store = self.store()
+        old = store.put('a.md', ['A2', '01 Jan 2014', ['z']])
+        self.assertEqual(old, self.record['a.md'])
+        self.assertEqual(store.remove('b.md'), self.record['b.md'])
+        store.commit()
+        store.close()
+        store = RecordStore(self.filename)
+        self.assertEqual(store.load(), {
+            'a.md': ['A2', '01 Jan 2014', ['z']],
+            'c.md': ['C', '02 Jan 2014', ['NO TAGS']],
+        })
+
+    def test_uncommitted_changes_are_dropped(self):
+        store = self.store()
+        store.put('d.md', ['D', '04 Jan 2014', []])
+        store.close()
+        self.assertEqual(RecordStore(self.filename).load(), self.record)
+
+    def test_queries(self):
+        store = self.store()
+        self.assertEqual(store.top(2), utils.sort_blogs(self.record, 2))
+        self.assertEqual(store.catalog(), {
+            'x': [('A', 'a.md')],
+            'y': [('B', 'b.md'), ('A', 'a.md')],
+            'NO TAGS': [('C', 'c.md')],
+        })
+        self.assertEqual(store.entries(['a.md', 'd.md']),
+                {'a.md': ['A', '01 Jan 2014', ['x', 'y']]})
+
+    def test_posts(self):
+        self.record['d.md'] = ['D', '03 Jan 2014', []]
+        store = self.store()
+        # the same in one chunk or one row at a time, ties broken by path
+        for chunk in (500, 1):
+            self.assertEqual([row[0] for row in store.posts(chunk)],
+                    ['b.md', 'd.md', 'c.md', 'a.md'])
+
+    def test_neighbours(self):
+        store = self.store()
+        key = utils.blog_sort_key
+        self.assertEqual(store.newest_before(key('03 Jan 2014')),
+                key('02 Jan 2014'))
+        self.assertEqual(store.newest_before(key('01 Jan 2014')), None)
+        self.assertEqual(store.oldest_from(key('02 Jan 2014')),
+                key('02 Jan 2014'))
+        self.assertEqual(store.oldest_from(key('04 Jan 2014')), None)
+
+    def test_tag_index(self):
+        store = self.store()
+        self.assertEqual(store.tags(), {'x': 1, 'y': 2, 'NO TAGS': 1})
+        self.assertEqual(store.tag_posts('y'), [
+            ('b.md', 'B', '03 Jan 2014'), ('a.md', 'A', '01 Jan 2014')])
+        store.put('b.md', ['B', '03 Jan 2014', ['x']])
+        self.assertEqual(store.tags(), {'x': 2, 'y': 1, 'NO TAGS': 1})
+
+    def test_migrate(self):
+        utils.write_json(self.json_record, self.record)
+        store = RecordStore(self.filename, self.json_record)
+        self.assertEqual(store.load(), self.record)
+        self.assertFalse(os.path.exists(self.json_record))
+        # only once
+        utils.write_json(self.json_record, {})
+        store.close()
+        self.assertEqual(RecordStore(self.filename, self.json_record).load(),
+                self.record)
+
+    def test_excerpts(self):
+        store = self.store()
+        self.assertEqual(store.excerpts(['a.md', 'b.md']), {})
+        store.put('a.md', self.record['a.md'], excerpt=(u'<p>a</p>', True))
+        store.set_excerpt('b.md', (u'<p>b</p>', False))
+        self.assertEqual(store.excerpts(['a.md', 'b.md', 'c.md']), {
+            'a.md': (u'<p>a</p>', True),
+            'b.md': (u'<p>b</p>', False),
+        })
+        # not part of the entries
+        self.assertEqual(store.load(), self.record)
+        # an entry put again without its excerpt keeps it, as reindex does
+        store.put('a.md', ['A2', '02 Jan 2014', ['x']])
+        self.assertEqual(store.excerpts(['a.md']),
+                {'a.md': (u'<p>a</p>', True)})
+        store.put('a.md', self.record['a.md'], excerpt=(u'<p>c</p>', False))
+        self.assertEqual(store.excerpts(['a.md']),
+                {'a.md': (u'<p>c</p>', False)})
+
+    def test_record_without_excerpts(self):
+        db = sqlite3.connect(self.filename)
+        db.execute('CREATE TABLE posts (path TEXT PRIMARY KEY, title TEXT, '
+                'date TEXT, sort_key REAL)')
+        db.execute("INSERT INTO posts VALUES ('a.md', 'A', '01 Jan 2014', 1)")
+        db.commit()
+        db.close()
+        store = RecordStore(self.filename)
+        self.assertEqual(store.excerpts(['a.md']), {})
+        store.set_excerpt('a.md', (u'<p>a</p>', False))
+        self.assertEqual(store.excerpts(['a.md']),
+                {'a.md': (u'<p>a</p>', False)})
+
+
+class SortKeyTests(unittest.TestCase):
+
+    def test_iso_dates(self):
+        for date in ['2014-05-03', '2014-5-3 10:20', '2014-05-03T10:20:30']:
+            self.assertEqual(utils.to_datetime(date),
+                    utils._parse_date(date).replace(tzinfo=None))
+        self.assertEqual(utils.parse_date('2014-05-03'), '03 May 2014')
+
+    def test_time_of_day(self):
+        self.assertTrue(utils.blog_sort_key('2014-05-03 10:20') >
+                utils.blog_sort_key('2014-05-03 09:00'))
+
+    def test_newest_first(self):
+        record = {
+            'a.md': ['A', '01 Jan 2014', []],
+            'b.md': ['B', '03 Jan 2014', []],
+            'c.md': ['C', '02 Jan 2014', []],
+            'd.md': ['D', '02 Jan 2014', []],
+        }
+        self.assertEqual(utils.sort_blogs(record),
+                ['b.md', 'c.md', 'd.md', 'a.md'])
+        self.assertEqual(utils.sort_blogs(record, 2), ['b.md', 'c.md'])
+        self.assertEqual(utils.sort_blogs(record, 10), utils.sort_blogs(record))
+        keys = {'a.md': utils.blog_sort_key('2015-01-01')}
+        self.assertEqual(utils.sort_blogs(record, 1, keys), ['a.md'])
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import sys
+import threading
+import traceback
+import unittest
+
+from mkblogs.build.scheduler import TaskGraph
+
+
+class TaskGraphTests(unittest.TestCase):
+
+    def test_dependencies_run_first(self):
+        done = []
+        lock = threading.Lock()
+
+        def work(name):
+            with lock:
+                done.append(name)
+
+        graph = TaskGraph()
+        graph.add('index', work, ('index',), deps=['blogs'])
+        graph.add('catalog', work, ('catalog',), deps=['blogs', 'pages'])
+        graph.add('blogs', work, ('blogs',))
+        graph.add('pages', work, ('pages',))
+        graph.run()
+
+        self.assertEqual(sorted(done), ['blogs', 'catalog', 'index', 'pages'])
+        self.assertTrue(done.index('blogs') < done.index('index'))
+        self.assertTrue(done.index('blogs') < done.index('catalog'))
+        self.assertTrue(done.index('pages') < done.index('catalog'))
+
+    def test_independent_tasks_overlap(self):
+        barrier = threading.Event()
+
+        def wait():
+            self.assertTrue(barrier.wait(5))
+
+        graph = TaskGraph()
+        graph.add('wait', wait)
+        graph.add('release', barrier.set)
+        graph.run()
+
+    def test_error_stops_dependents(self):
+        done = []
+
+        def fail():
+            raise IOError('disk full')
+
+        graph = TaskGraph()
+        graph.add('blogs', fail)
+        graph.add('index', done.append, ('index',), deps=['blogs'])
+        self.assertRaises(IOError, graph.run)
+        self.assertEqual(done, [])
+
+    def test_error_traceback(self):
+        def fail():
+            raise IOError('disk full')
+
+        graph = TaskGraph()
+        graph.add('blogs', fail)
+        try:
+            graph.run()
+        except IOError:
+            tb = traceback.extract_tb(sys.exc_info()[2])
+        # it still shows where the task failed
+        self.assertEqual(tb[-1][2], 'fail')
+
+    def test_unknown_dependency(self):
+        graph = TaskGraph()
+        graph.add('index', lambda: None, deps=['blogs'])
+        self.assertRaises(ValueError, graph.run)
+
+    def test_cycle(self):
+        graph = TaskGraph()
+        graph.add('a', lambda: None, deps=['b'])
+        graph.add('b', lambda: None, deps=['a'])
+        self.assertRaises(ValueError, graph.run)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mkblogs.build.manifest import BuildManifest
+from mkblogs.build.sources import IgnoreRules, walk_sources
+
+
+class IgnoreRulesTests(unittest.TestCase):
+
+    def test_name(self):
+        rules = IgnoreRules(['draft.md\n', '# a comment\n', '\n'])
+        self.assertTrue(rules.match('draft.md'))
+        self.assertTrue(rules.match('2014/05/draft.md'))
+        self.assertFalse(rules.match('post.md'))
+        self.assertFalse(rules.match('# a comment'))
+
+    def test_anchored(self):
+        rules = IgnoreRules(['/notes.md', 'a/*.md'])
+        self.assertTrue(rules.match('notes.md'))
+        self.assertFalse(rules.match('2014/notes.md'))
+        self.assertTrue(rules.match('a/post.md'))
+        self.assertFalse(rules.match('a/b/post.md'))
+        self.assertFalse(rules.match('b/a/post.md'))
+
+    def test_double_star(self):
+        rules = IgnoreRules(['2013/**/*.md', '**/tmp'])
+        self.assertTrue(rules.match('2013/post.md'))
+        self.assertTrue(rules.match('2013/05/post.md'))
+        self.assertFalse(rules.match('2014/05/post.md'))
+        self.assertTrue(rules.match('tmp', True))
+        self.assertTrue(rules.match('a/b/tmp', True))
+
+    def test_dir_only(self):
+        rules = IgnoreRules(['drafts/'])
+        self.assertTrue(rules.match('drafts', True))
+        self.assertTrue(rules.match('2014/drafts', True))
+        self.assertFalse(rules.match('drafts'))
+
+    def test_negate(self):
+        rules = IgnoreRules(['*.md', '!keep?.md', '[ab].md'])
+        self.assertTrue(rules.match('post.md'))
+        self.assertFalse(rules.match('keep1.md'))
+        self.assertTrue(rules.match('a.md'))
+
+
+class WalkSourcesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.docs_dir = tempfile.mkdtemp()
+        for path in ['post.md', 'img/x.png', '2014/05/nested.md',
+                '2014/drafts/draft.md', '2014/skip.md', '.hidden/post.md']:
+            self.write(path, 'title: post\n')
+        self.write('.ignore', 'drafts/\nskip.md\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.docs_dir)
+
+    def write(self, path, content):
+        path = os.path.join(self.docs_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def walk(self, **kwargs):
+        return dict(walk_sources(self.docs_dir, **kwargs))
+
+    def test_walk(self):
+        found = self.walk()
+        self.assertEqual(sorted(found),
+                [os.path.join('2014', '05', 'nested.md'), 'post.md'])
+        self.assertEqual(found['post.md'].st_size, len('title: post\n'))
+
+    def test_pages(self):
+        found = self.walk(pages=[os.path.join(self.docs_dir, 'post.md')])
+        self.assertEqual(list(found), [os.path.join('2014', '05', 'nested.md')])
+
+    def test_prune(self):
+        # saving the manifest must not change the mtime of the docs dir
+        self.write('.manifest', '{}')
+        manifest = BuildManifest(os.path.join(self.docs_dir, '.manifest'),
+                self.docs_dir, 'toolchain')
+        nested = os.path.join('2014', '05', 'nested.md')
+        self.assertEqual(sorted(self.walk(manifest=manifest, prune=True)),
+                [nested, 'post.md'])
+        manifest.save()
+
+        manifest = BuildManifest(os.path.join(self.docs_dir, '.manifest'),
+                self.docs_dir, 'toolchain')
+        found = self.walk(manifest=manifest, prune=True)
+        self.assertEqual(found, {'post.md': None, nested: None})
+
+        # a new file changes the mtime of its directory only
+        self.write('2014/05/new.md', 'title: new\n')
+        later = time.time() + 10
+        os.utime(os.path.join(self.docs_dir, '2014', '05'), (later, later))
+        found = self.walk(manifest=manifest, prune=True)
+        self.assertEqual(found['post.md'], None)
+        self.assertTrue(found[os.path.join('2014', '05', 'new.md')])
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import jinja2
+
+from mkblogs import utils
+from mkblogs.build import nav
+from mkblogs.build.build_pages import build_catalog, tag_page_path
+from mkblogs.build.manifest import TrackingEnvironment
+from mkblogs.build.tags import touched_tags
+
+
+class TagPagesTests(unittest.TestCase):
+
+    def test_paths(self):
+        self.assertEqual(utils.tag_slug(u'python'), u'python')
+        self.assertEqual(utils.tag_slug(u'c-tips'), u'c-tips')
+        self.assertTrue(utils.tag_slug(u'C++ Tips').startswith(u'c-tips-'))
+        self.assertTrue(utils.tag_slug(u'++').startswith(u'tag-'))
+        self.assertEqual(tag_page_path(u'python'), u'tags/python.html')
+        self.assertEqual(tag_page_path(u'python', 3, 't'), u't/python-3.html')
+
+    def test_unique_paths(self):
+        tags = [u'C', u'c', u'C++', u'c#', u'++', u'--', u'a b', u'a-b',
+                u'python-2', u'Python']
+        paths = set()
+        for tag in tags:
+            paths.update(tag_page_path(tag, n) for n in (1, 2))
+        self.assertEqual(len(paths), 2 * len(tags))
+
+    def test_touched_tags(self):
+        old = ['A', '01 Jan 2014', ['x', 'y']]
+        self.assertEqual(touched_tags({'a.md': (old, list(old))}), set())
+        self.assertEqual(touched_tags({'a.md': (old, ['A', '01 Jan 2014',
+            ['y', 'z']])}), set(['x', 'z']))
+        self.assertEqual(touched_tags({'a.md': (old, ['B', '01 Jan 2014',
+            ['x', 'y']])}), set(['x', 'y']))
+        self.assertEqual(touched_tags({'a.md': (None, old),
+            'b.md': (['B', '01 Jan 2014', ['w']], None)}),
+            set(['w', 'x', 'y']))
+
+
+class CatalogTests(unittest.TestCase):
+
+    def test_catalog_from_data(self):
+        work_dir = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            env = TrackingEnvironment(loader=jinja2.DictLoader({
+                'base.html': '{% include structure %}',
+                'catalog.html': '{% for c in catalog %}{{ c.tag }} {{ c.url }}:'
+                    '{% for b in c.blogs %} {{ b.title }} {{ b.url }}'
+                    '{% endfor %};{% endfor %}',
+            }))
+            config = {
+                'catalist': {u'b': [(u'B', u'2014/b.md')],
+                    u'a': [(u'A', u'a.md')]},
+                'site_dir': 'site', 'site_name': 'test', 'site_favicon': None,
+                'site_description': None, 'site_author': None,
+                'site_url': None, 'extra_javascript': [], 'extra_css': [],
+                'repo_url': None, 'repo_name': None, 'include_nav': True,
+                'include_next_prev': True, 'include_search': False,
+                'copyright': None, 'google_analytics': None,
+            }
+            site_navigation = nav.SiteNavigation(['catalog.md'])
+            page = site_navigation.get_page('Catalog')
+            build_catalog(page, config, site_navigation, env)
+            self.assertEqual(os.listdir(work_dir), ['catalog.html'])
+            with open('catalog.html') as f:
+                self.assertEqual(f.read(), 'a tags/a.html: A site/a.html;'
+                        'b tags/b.html: B site/2014/b.html;')
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(work_dir)
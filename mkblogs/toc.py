@@ -3,26 +3,37 @@
 """
 Deals with generating the per-page table of contents.
 
-For the sake of simplicity we use an existing markdown extension to generate
-an HTML table of contents, and then parse that into the underlying data.
+The markdown `toc` extension gives every heading an id. While converting, the
+headings are collected from the tree along with the links, as (level, id,
+title), and the table of contents is made of them only when a template looks
+at it, most pages never do.
 
-The steps we take to generate a table of contents are:
-
-* Pre-process the markdown, injecting a [TOC] marker.
-* Generate HTML from markdown.
-* Post-process the HTML, spliting the content and the table of contents.
-* Parse table of contents HTML into the underlying data structure.
+A table of contents can still be made of the HTML of the `toc` extension,
+parsed in one go.
 """
 
-from mkblogs.compat import HTMLParser
+from markdown.util import etree
+
+from mkblogs import utils
 
 
 class TableOfContents(object):
     """
-    Represents the table of contents for a given page.
+    Represents the table of contents for a given page, made of a list of
+    (level, id, title) of its headings, or of the HTML of the toc extension.
     """
-    def __init__(self, html):
-        self.items = _parse_html_table_of_contents(html)
+    def __init__(self, headings):
+        self.headings = headings
+        self._items = None
+
+    @property
+    def items(self):
+        if self._items is None:
+            if isinstance(self.headings, (list, tuple)):
+                self._items = _nest_headings(self.headings)
+            else:
+                self._items = _parse_html_table_of_contents(self.headings)
+        return self._items
 
     def __iter__(self):
         return iter(self.items)
@@ -50,30 +61,45 @@ class AnchorLink(object):
         return ret
 
 
-class TOCParser(HTMLParser):
-
-    def __init__(self):
-        HTMLParser.__init__(self)
-        self.links = []
-
-        self.in_anchor = True
-        self.attrs = None
-        self.title = ''
+def _nest_headings(headings):
+    """
+    Turn the (level, id, title) of the headings of a page into a tree of
+    AnchorLink instances, nested as the toc extension nests them: a heading
+    is a child of the last heading of a lower level before it.
 
-    def handle_starttag(self, tag, attrs):
+    Returns a list of all the parent AnchorLink instances.
+    """
+    ret = []
+    parents = []
+    for level, anchor, title in headings:
+        nav = AnchorLink(title, '#' + anchor)
+        while parents and parents[-1][0] >= level:
+            parents.pop()
+        if parents:
+            parents[-1][1].children.append(nav)
+        else:
+            ret.append(nav)
+        parents.append((level, nav))
 
-        if tag == 'a':
-            self.in_anchor = True
-            self.attrs = dict(attrs)
+    # For the table of contents, always mark the first element as active
+    if ret:
+        ret[0].active = True
 
-    def handle_endtag(self, tag):
-        if tag == 'a':
-            self.in_anchor = False
+    return ret
 
-    def handle_data(self, data):
 
-        if self.in_anchor:
-            self.title += data
+def _parse_list(ul):
+    ret = []
+    if ul is None:
+        return ret
+    for li in ul.findall('li'):
+        anchor = li.find('a')
+        if anchor is None:
+            continue
+        nav = AnchorLink(utils.element_text(anchor), anchor.get('href'))
+        nav.children = _parse_list(li.find('ul'))
+        ret.append(nav)
+    return ret
 
 
 def _parse_html_table_of_contents(html):
@@ -83,28 +109,14 @@ def _parse_html_table_of_contents(html):
 
     Returns a list of all the parent AnchorLink instances.
     """
-    lines = html.splitlines()[2:-2]
-    parents = []
-    ret = []
-    for line in lines:
-        parser = TOCParser()
-        parser.feed(line)
-        if parser.title:
-            href = parser.attrs['href']
-            title = parser.title
-            nav = AnchorLink(title, href)
-            # Add the item to its parent if required.  If it is a topmost
-            # item then instead append it to our return value.
-            if parents:
-                parents[-1].children.append(nav)
-            else:
-                ret.append(nav)
-            # If this item has children, store it as the current parent
-            if line.endswith('<ul>'):
-                parents.append(nav)
-        elif line.startswith('</ul>'):
-            if parents:
-                parents.pop()
+    if not html:
+        return []
+    try:
+        div = etree.fromstring(html.encode('utf-8'))
+    except SyntaxError:
+        # ParseError, entities the xml parser doesn't know
+        return []
+    ret = _parse_list(div.find('ul'))
 
     # For the table of contents, always mark the first element as active
     if ret:
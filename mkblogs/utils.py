@@ -7,26 +7,86 @@ Nothing in this module should have an knowledge of config or the layout
 and structure of the site and pages in the site.
 """
 
+import heapq
 import os
+import re
 import shutil
-import operator
 import time
 import json
+import hashlib
 
 from mkblogs import exceptions
-from mkblogs.compat import urlparse
+from mkblogs.compat import urlparse, text_type
 from dateutil.parser import parse as _parse_date
 from datetime import datetime
 import threading
 
+_ISO_DATE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})'
+        r'(?:[T ](\d{1,2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?)?$')
+#date string -> datetime, the same dates are parsed by every build
+_parsed_dates = {}
+
+def to_datetime(date_string):
+    """
+    parse a date of a blog meta, plain ISO dates without a timezone are
+    parsed directly, the rest by dateutil
+    """
+    parsed = _parsed_dates.get(date_string)
+    if parsed is None:
+        match = _ISO_DATE.match(date_string.strip())
+        if match:
+            parsed = datetime(*[int(field) for field in match.groups()
+                if field is not None])
+        else:
+            parsed = _parse_date(date_string)
+        _parsed_dates[date_string] = parsed
+    return parsed
+
 def parse_date(date_string):
     #FIXME: argument must 9 item sequence, not datetime datetime
-    return _parse_date(date_string).strftime("%d %b %Y")
+    return to_datetime(date_string).strftime("%d %b %Y")
+
+def blog_sort_key(date_string):
+    """
+    the number blogs are sorted by, from the date in their meta, the time of
+    the day included. The date of a record entry works too, the time is lost
+    there.
+    """
+    return time.mktime(to_datetime(date_string).timetuple())
 
-def sort_blogs(dic):
-    to_sort = [(x, time.mktime(_parse_date(dic[x][1]).timetuple()) ) for x in dic.keys()]
-    sorted_blogs = sorted(to_sort, key=operator.itemgetter(1))
-    return [x[0] for x in sorted_blogs]
+def _newest_first(item):
+    path, key = item
+    return (-key, path)
+
+def sort_blogs(dic, n=None, keys=None):
+    """
+    the paths of the blogs of the record @dic, newest first, only the @n
+    newest if given. @keys maps paths to their blog_sort_key if known
+    already.
+    """
+    keys = keys or {}
+    to_sort = [(x, keys[x] if x in keys else blog_sort_key(dic[x][1]))
+            for x in dic.keys()]
+    if n is not None:
+        return [x[0] for x in heapq.nsmallest(n, to_sort, key=_newest_first)]
+    return [x[0] for x in sorted(to_sort, key=_newest_first)]
+
+
+_NOT_SLUG = re.compile(r'[^\w]+', re.UNICODE)
+#the suffix of the pages past the first of a tag
+_PAGE_SUFFIX = re.compile(r'-\d+$')
+
+def tag_slug(tag):
+    """
+    @tag as a file name. A tag which is not a file name as it is, or which
+    looks like a page of another tag, gets a digest of itself appended, so
+    'C' and 'C++' don't share a file
+    """
+    slug = _NOT_SLUG.sub('-', tag.lower()).strip('-')
+    if slug == tag and not _PAGE_SUFFIX.search(slug):
+        return slug
+    data = tag.encode('utf-8') if isinstance(tag, text_type) else tag
+    return '%s-%s' % (slug or 'tag', hashlib.sha1(data).hexdigest()[:8])
 
 
 def copy_file(source_path, output_path):
@@ -41,16 +101,49 @@ def copy_file(source_path, output_path):
     shutil.copy(source_path, output_path)
 
 
-def write_file(content, output_path):
+def write_file(content, output_path, known_digest=None):
     """
     Write content to output_path, making sure any parent directories exist.
+
+    An existing file already holding content is left untouched, so its mtime
+    doesn't change. known_digest is the content_digest the file had when it
+    was last written, if known, which saves reading it back. Returns True if
+    the file was written.
     """
+    if os.path.exists(output_path):
+        digest = content_digest(content)
+        if known_digest is None:
+            known_digest = file_digest(output_path)
+        if digest == known_digest:
+            return False
+
     output_dir = os.path.dirname(output_path)
     if output_dir == '' or os.path.exists(output_dir):
         pass
     else:
         os.makedirs(output_dir)
-    open(output_path, 'wb').write(content)
+    with open(output_path, 'wb') as f:
+        f.write(content)
+    return True
+
+
+def content_digest(content):
+    """
+    Return the sha1 hex digest of content, the same as file_digest of a file
+    holding content.
+    """
+    return hashlib.sha1(content).hexdigest()
+
+
+def file_digest(path):
+    """
+    Return the sha1 hex digest of the content of the file at path.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
 
 
 def clean_directory(directory):
@@ -74,10 +167,21 @@ def clean_directory(directory):
             os.unlink(path)
 
 
-def copy_media_files(from_dir, to_dir):
+def copy_media_files(from_dir, to_dir, mode='copy', nthread=1):
     """
     Recursively copy all files except markdown into another directory.
+
+    mode is one of:
+    'copy': copy every file.
+    'incremental': skip files whose size and mtime match the destination,
+        copies keep the mtime of the source.
+    'link': hardlink files when both directories are on one filesystem, fall
+        back to 'incremental' copies otherwise.
+
+    Files are copied by nthread threads. Returns the number of bytes copied
+    and of bytes skipped.
     """
+    jobs = []
     for (source_dir, dirnames, filenames) in os.walk(from_dir):
         relative_path = os.path.relpath(source_dir, from_dir)
         output_dir = os.path.normpath(os.path.join(to_dir, relative_path))
@@ -93,7 +197,129 @@ def copy_media_files(from_dir, to_dir):
             if not is_markdown_file(filename):
                 source_path = os.path.join(source_dir, filename)
                 output_path = os.path.join(output_dir, filename)
-                copy_file(source_path, output_path)
+                jobs.append((source_path, output_path, mode))
+
+    copied = skipped = 0
+    for size, done in run_in_threads(_copy_media_file, jobs, nthread):
+        if done:
+            copied += size
+        else:
+            skipped += size
+    return copied, skipped
+
+
+def _copy_media_file(job):
+    """
+    copy one media file, return its size and whether it was copied
+    """
+    source_path, output_path, mode = job
+    st = os.stat(source_path)
+    if mode == 'copy':
+        copy_file(source_path, output_path)
+        return st.st_size, True
+
+    try:
+        out_st = os.stat(output_path)
+    except OSError:
+        out_st = None
+    if out_st:
+        if mode == 'link' and os.path.samestat(st, out_st):
+            return st.st_size, False
+        # a copy made when linking failed is skipped as in 'incremental'.
+        # copies keep the mtime of their source to the microsecond, what
+        # utime of python 2 keeps of it
+        if out_st.st_size == st.st_size and \
+                abs(out_st.st_mtime - st.st_mtime) < 2e-6:
+            return st.st_size, False
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        try:
+            os.makedirs(output_dir)
+        except OSError:
+            # another thread made it
+            if not os.path.isdir(output_dir):
+                raise
+    if mode == 'link':
+        if out_st:
+            os.unlink(output_path)
+        try:
+            os.link(source_path, output_path)
+            return st.st_size, True
+        except (OSError, AttributeError):
+            # different filesystems, or no hardlinks here
+            pass
+    with open(source_path, 'rb') as fsrc:
+        with open(output_path, 'wb') as fdst:
+            _copy_file_data(fsrc, fdst, st.st_size)
+    shutil.copymode(source_path, output_path)
+    os.utime(output_path, (st.st_atime, st.st_mtime))
+    return st.st_size, True
+
+
+def _copy_file_data(fsrc, fdst, size):
+    """
+    copy the content of fsrc to fdst inside the kernel when the platform can,
+    copy_file_range may even share the blocks on filesystems with reflinks
+    """
+    for name in ('copy_file_range', 'sendfile'):
+        kernel_copy = getattr(os, name, None)
+        if kernel_copy is None:
+            continue
+        offset = 0
+        try:
+            while offset < size:
+                if name == 'sendfile':
+                    sent = kernel_copy(fdst.fileno(), fsrc.fileno(), offset,
+                            size - offset)
+                else:
+                    sent = kernel_copy(fsrc.fileno(), fdst.fileno(),
+                            size - offset, offset, offset)
+                if not sent:
+                    break
+                offset += sent
+        except OSError:
+            # not supported between these files, try the next way
+            fdst.seek(0)
+            fdst.truncate()
+            continue
+        if offset == size:
+            return
+        fdst.seek(0)
+        fdst.truncate()
+    fsrc.seek(0)
+    shutil.copyfileobj(fsrc, fdst, 1 << 20)
+
+
+def run_in_threads(func, items, nthread):
+    """
+    Call func on every item with nthread threads, return the results in no
+    particular order. The first exception raised by func is raised again
+    once every thread is done.
+    """
+    todo = AtomicList(items)
+    results = AtomicList()
+    errors = AtomicList()
+
+    def work():
+        while not errors:
+            item = todo.pop()
+            if item is None:
+                break
+            try:
+                results.append(func(item))
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=work)
+            for i in range(max(1, min(nthread, len(items))))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return list(results)
 
 
 def get_html_path(path):
@@ -260,6 +486,16 @@ def create_relative_media_url(url_context, url):
 
     return relative_path
 
+def element_text(element):
+    """
+    the text of the etree @element and of its descendants
+    """
+    text = [element.text or '']
+    for child in element:
+        text.append(element_text(child))
+        text.append(child.tail or '')
+    return ''.join(text)
+
 def load_json(filename):
     jsonobj = {}
     if os.path.isfile(filename):
@@ -305,6 +541,23 @@ class AtomicList(list):
         super(AtomicList, self).append(val)
         self.lock.release()
 
+class AtomicCounter(object):
+    """
+    named counters shared by threads
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, name, value=1):
+        self.lock.acquire()
+        self.counts[name] = self.counts.get(name, 0) + value
+        self.lock.release()
+
+    def __getitem__(self, name):
+        return self.counts.get(name, 0)
+
+
 class AtomicDict(dict):
     def __init__(self, *args):
         self.lock = threading.Lock()